@@ -27,7 +27,7 @@
 #
 # -----------------------------------------------------------------------------
 
-__all__ = [ 'Channel', 'Program', 'QExpr', 'get_channels', 'get_channel', 'search', 'update' ]
+__all__ = [ 'Channel', 'Program', 'QExpr', 'get_channels', 'get_channel', 'set_channel_sort_number', 'search', 'iter_search', 'count', 'get_grid', 'get_now_next', 'snapshot_arrays', 'plan_recordings', 'get_airings', 'get_series', 'complete', 'get_genre_counts', 'get_stats', 'update' ]
 
 # python imports
 import logging
@@ -48,12 +48,13 @@ log = logging.getLogger('epg')
 guide = None
 server = []
 
-def load(database):
+def load(database, **kwargs):
     """
-    Load a database
+    Load a database.  Keyword arguments are passed to the
+    :class:`~kaa.epg.guide.Guide` constructor.
     """
     global guide
-    guide = Guide(database)
+    guide = Guide(database, **kwargs)
     return guide
 
 def connect(address='epg', secret=''):
@@ -84,6 +85,12 @@ def get_channel(name):
     """
     return guide.get_channel(name)
 
+def set_channel_sort_number(channel, sort_number):
+    """
+    Set the position of a channel in the sorted channel list
+    """
+    return guide.set_channel_sort_number(channel, sort_number)
+
 def get_channel_by_tuner_id(tuner_id):
     """
     Return the channel with the given tuner id.
@@ -96,18 +103,84 @@ def search(channel=None, time=None, cls=Program, **kwargs):
     """
     return guide.search(channel, time, cls, **kwargs)
 
+def iter_search(channel=None, time=None, cls=Program, chunk_size=100, **kwargs):
+    """
+    Search the db and return a cursor fetching the programs in chunks.
+    """
+    return guide.iter_search(channel, time, cls, chunk_size, **kwargs)
+
+def count(channel=None, time=None, count_by=None, **kwargs):
+    """
+    Count the programs matching a search.
+    """
+    return guide.count(channel, time, count_by, **kwargs)
+
+def get_grid(channels, start, stop, cls=Program, fill_gaps=False):
+    """
+    Return the programs of the given channels within a time window.
+    """
+    return guide.get_grid(channels, start, stop, cls, fill_gaps)
+
+def get_now_next(channels=None, cls=Program):
+    """
+    Return the current and next program of the given channels.
+    """
+    return guide.get_now_next(channels, cls)
+
+def snapshot_arrays(start=None, stop=None):
+    """
+    Return all programs of a time window as parallel numpy arrays.
+    """
+    return guide.snapshot_arrays(start, stop)
+
+def get_airings(program, cls=Program):
+    """
+    Return all airings of a program.
+    """
+    return guide.get_airings(program, cls)
+
+def get_series(title, cls=Program):
+    """
+    Return all programs of a series.
+    """
+    return guide.get_series(title, cls)
+
+def plan_recordings(requests, tuners=1, padding=0, cls=Program):
+    """
+    Assign the programs matching the given requests to tuners.
+    """
+    return guide.plan_recordings(requests, tuners, padding, cls)
+
 def get_keywords(associated=None, prefix=None):
     """
     Retrieves a list of keywords in the database.
     """
     return guide.get_keywords(associated, prefix)
 
+def complete(prefix, limit=10):
+    """
+    Complete a search term from the keywords and titles in the database.
+    """
+    return guide.complete(prefix, limit)
+
+def get_genre_counts(time=None, channel=None):
+    """
+    Return the number of programs per genre within the given time window.
+    """
+    return guide.get_genre_counts(time, channel)
+
 def get_genres(associated=None, prefix=None):
     """
     Retrieves a list of genres in the database.
     """
     return guide.get_genres(associated, prefix)
 
+def get_stats(reset=False):
+    """
+    Return the query latency statistics.
+    """
+    return guide.get_stats(reset)
+
 class _SourcesWrapper(object):
     """
     Wrap kaa.epg.sources import to avoid importing
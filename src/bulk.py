@@ -0,0 +1,250 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# bulk.py - Batched inserts and deletes of objects
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+
+# kaa.db writes every added object with one INSERT plus one query and
+# several statements per inverted index.  The BulkWriter collects the added
+# and deleted objects of one type and writes them with executemany()
+# statements, the inverted index terms of the whole batch are looked up and
+# counted once.  The result in the database is the same as calling add()
+# and delete() for every object, except that terms no longer used by any
+# object are removed right away instead of on the next vacuum.
+
+__all__ = [ 'BulkWriter' ]
+
+# Maximum number of parameters in one statement, sqlite allows 999
+CHUNK = 500
+
+
+def _chunks(items):
+    """
+    Split a list into slices of at most CHUNK items.
+    """
+    for pos in range(0, len(items), CHUNK):
+        yield items[pos:pos+CHUNK]
+
+
+class BulkWriter(object):
+    """
+    Collect added and deleted objects of one object type and write them in
+    one batch on flush().  Added objects get a negative temporary id until
+    they are written, update() and delete() accept these ids.  Objects
+    deleted by the writer must not have children.  The caller has to commit
+    the database.
+    """
+    def __init__(self, db, object_type):
+        self._db = db
+        self._type = object_type
+        # Temporary id -> (parent, attrs), in order of the add() calls
+        self._added = {}
+        self._deleted = []
+        self._next_id = -1
+
+
+    def add(self, parent, **attrs):
+        """
+        Add an object, return the temporary id.
+        """
+        tmp_id = self._next_id
+        self._next_id -= 1
+        self._added[tmp_id] = parent, attrs
+        return tmp_id
+
+
+    def update(self, object_id, **attrs):
+        """
+        Update an object.  Existing objects are updated in the database right
+        away, added objects before they are written.
+        """
+        if object_id in self._added:
+            self._added[object_id][1].update(attrs)
+        else:
+            self._db.update((self._type, object_id), **attrs)
+
+
+    def delete(self, object_id):
+        """
+        Delete an object.  Objects added by this writer are simply dropped.
+        """
+        if object_id in self._added:
+            del self._added[object_id]
+        else:
+            self._deleted.append(object_id)
+
+
+    def __len__(self):
+        return len(self._added) + len(self._deleted)
+
+
+    def flush(self):
+        """
+        Write all pending changes.  Return the number of deleted and the
+        number of added objects.
+        """
+        # Other threads must not use the cursor between a statement and
+        # reading its rowcount.
+        self._db._lock.acquire()
+        try:
+            deleted, affected = self._flush_deleted()
+            added = self._flush_added()
+            # After adding, so terms used by new objects are kept.
+            self._purge_terms(affected)
+        finally:
+            self._db._lock.release()
+        if deleted or added:
+            self._db._set_dirty()
+        return deleted, added
+
+
+    def _flush_deleted(self):
+        """
+        Delete the objects and their inverted index terms.  Return the number
+        of deleted objects and a dict ivtidx -> set of ids of the terms used
+        by them.
+        """
+        db, ids, count = self._db, self._deleted, 0
+        self._deleted = []
+        type_id = db._get_type_id(self._type)
+        ivtidxes = db._get_type_inverted_indexes(self._type)
+        affected = dict((ivtidx, set()) for ivtidx in ivtidxes)
+        for chunk in _chunks(ids):
+            placeholders = ','.join('?' * len(chunk))
+            for ivtidx in ivtidxes:
+                for row in db._db_query('SELECT DISTINCT term_id FROM ivtidx_%s_terms_map ' \
+                                        'WHERE object_type=? AND object_id IN (%s)' % (ivtidx, placeholders),
+                                        [ type_id ] + chunk):
+                    affected[ivtidx].add(row[0])
+                # A trigger decrements the count of the terms.
+                db._db_query('DELETE FROM ivtidx_%s_terms_map WHERE object_type=? AND object_id IN (%s)' % \
+                             (ivtidx, placeholders), [ type_id ] + chunk)
+            # A trigger decrements the objectcount of the inverted indexes.
+            db._db_query('DELETE FROM objects_%s WHERE id IN (%s)' % (self._type, placeholders), chunk)
+            rows = db._cursor.rowcount
+            for ivtidx in ivtidxes:
+                db._inverted_indexes[ivtidx]['objectcount'] -= rows
+            count += rows
+        return count, affected
+
+
+    def _purge_terms(self, affected):
+        """
+        Remove the terms of deleted objects that are no longer used.  Only
+        the given term ids are checked, the terms table has no index on the
+        count.
+        """
+        for ivtidx, term_ids in affected.items():
+            for chunk in _chunks(list(term_ids)):
+                self._db._db_query('DELETE FROM ivtidx_%s_terms WHERE count=0 AND id IN (%s)' % \
+                                   (ivtidx, ','.join('?' * len(chunk))), chunk)
+
+
+    def _flush_added(self):
+        """
+        Insert the objects with ids assigned in advance, then add their
+        terms to the inverted indexes.
+        """
+        db, added = self._db, self._added
+        self._added = {}
+        if not added:
+            return 0
+        type_id = db._get_type_id(self._type)
+        type_attrs = db._get_type_attrs(self._type)
+        ivtidxes = db._get_type_inverted_indexes(self._type)
+        # Next id the AUTOINCREMENT column would use
+        table = 'objects_%s' % self._type
+        row = db._db_query_row('SELECT max(seq) FROM sqlite_sequence WHERE name=?', (table,))
+        next_id = max(row[0] if row and row[0] else 0,
+                      db._db_query_row('SELECT max(id) FROM %s' % table)[0] or 0) + 1
+        # Query -> list of values, objects with the same set of attributes
+        # share the query.
+        inserts = {}
+        # ivtidx -> list of (object id, terms)
+        ivtidx_terms = dict((ivtidx, []) for ivtidx in ivtidxes)
+        for tmp_id in sorted(added, reverse=True):
+            parent, attrs = added[tmp_id]
+            attrs = attrs.copy()
+            if parent:
+                attrs['parent_type'], attrs['parent_id'] = db._to_obj_tuple(parent, numeric=True)
+            attrs['id'] = object_id = next_id
+            next_id += 1
+            for ivtidx in ivtidxes:
+                split = db._inverted_indexes[ivtidx]['split']
+                terms_list = []
+                for name, (attr_type, flags, attr_ivtidx, attr_split) in type_attrs.items():
+                    if attr_ivtidx == ivtidx and name in attrs:
+                        terms_list.append((attrs[name], 1.0, attr_split or split, ivtidx))
+                if ivtidx in attrs and ivtidx not in type_attrs:
+                    terms_list.append((attrs[ivtidx], 1.0, split, ivtidx))
+                terms = db._score_terms(terms_list)
+                if terms:
+                    ivtidx_terms[ivtidx].append((object_id, terms))
+                    if ivtidx in type_attrs:
+                        attrs[ivtidx] = terms.keys()
+            query, values = db._make_query_from_attrs('add', attrs, self._type)
+            inserts.setdefault(query, []).append(values)
+        for query, values in inserts.items():
+            db._db_query(query, values, many = True)
+        for ivtidx in ivtidxes:
+            db._db_query("UPDATE inverted_indexes SET value=value+? WHERE attr='objectcount' AND name=?",
+                         (len(added), ivtidx))
+            db._inverted_indexes[ivtidx]['objectcount'] += len(added)
+            self._add_terms(ivtidx, type_id, ivtidx_terms[ivtidx])
+        return len(added)
+
+
+    def _add_terms(self, ivtidx, type_id, objects):
+        """
+        Add the terms of all objects, a list of (object id, terms) with terms
+        as returned by Database._score_terms(), to the inverted index.
+        """
+        db = self._db
+        # Number of new objects per term
+        counts = {}
+        for object_id, terms in objects:
+            for term in terms:
+                term = term.lower()
+                counts[term] = counts.get(term, 0) + 1
+        if not counts:
+            return
+        term_ids = {}
+        update = []
+        for chunk in _chunks(counts.keys()):
+            for term_id, term in db._db_query('SELECT id, term FROM ivtidx_%s_terms WHERE term IN (%s)' % \
+                                              (ivtidx, ','.join('?' * len(chunk))), chunk):
+                term_ids[term] = term_id
+                update.append((counts[term], term_id))
+        db._db_query('UPDATE ivtidx_%s_terms SET count=count+? WHERE id=?' % ivtidx, update, many = True)
+        new = [ term for term in counts if term not in term_ids ]
+        db._db_query('INSERT INTO ivtidx_%s_terms VALUES(NULL, ?, ?)' % ivtidx,
+                     [ (term, counts[term]) for term in new ], many = True)
+        for chunk in _chunks(new):
+            for term_id, term in db._db_query('SELECT id, term FROM ivtidx_%s_terms WHERE term IN (%s)' % \
+                                              (ivtidx, ','.join('?' * len(chunk))), chunk):
+                term_ids[term] = term_id
+        db._db_query('INSERT INTO ivtidx_%s_terms_map VALUES(?, ?, ?, ?, ?)' % ivtidx,
+                     [ (int(score * 10), term_ids[term.lower()], type_id, object_id, score)
+                       for object_id, terms in objects for term, score in terms.items() ], many = True)
@@ -0,0 +1,115 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# cache.py - LRU cache for search results
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+__all__ = [ 'QueryCache' ]
+
+# python imports
+import time
+from collections import OrderedDict
+
+# kaa imports
+from kaa.db import QExpr
+
+
+class QueryCache(object):
+    """
+    Bounded LRU cache of raw query results.
+
+    All entries belong to one guide generation.  When the guide is synced
+    from the database the generation changes and the whole cache is dropped
+    on the next access.
+    """
+    def __init__(self, size=128, ttl=None):
+        """
+        :param size: maximum number of cached queries
+        :param ttl: maximum age of an entry in seconds or None for no limit
+        """
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = None
+
+    def make_key(self, channels, start, stop, kwargs):
+        """
+        Return a hashable key for the given query or None if the query
+        can not be cached.
+        """
+        try:
+            key = (tuple(sorted(channels)) if channels is not None else None, start, stop,
+                   tuple(sorted((k, self._normalize(v)) for k, v in kwargs.items())))
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _normalize(self, value):
+        if isinstance(value, QExpr):
+            return 'QExpr', value._operator, self._normalize(value._operand)
+        if isinstance(value, (list, tuple)):
+            return tuple(self._normalize(v) for v in value)
+        return value
+
+    def get(self, key, generation):
+        """
+        Return the cached result for key or None.
+        """
+        if generation != self._generation:
+            self.clear()
+            self._generation = generation
+        entry = self._entries.pop(key, None)
+        if entry is None or (self.ttl and entry[0] + self.ttl < time.time()):
+            self.misses += 1
+            return None
+        # Re-insert to mark the entry as most recently used.
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, generation, value):
+        """
+        Add a query result to the cache.
+        """
+        if generation != self._generation:
+            self.clear()
+            self._generation = generation
+        self._entries[key] = time.time(), value
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        self._entries.clear()
+
+    def get_stats(self):
+        """
+        Return a dict with size, hits and misses of the cache.
+        """
+        return dict(size=len(self._entries), hits=self.hits, misses=self.misses)
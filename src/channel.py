@@ -36,7 +36,19 @@ class Channel(object):
     kaa.epg.Channel class.
     """
     def __init__(self, dbdata):
-        self._dbdata = dbdata
+        if type(dbdata) is dict:
+            # Plain dicts (e.g. from the channel snapshot) need no unpickling.
+            self._load(dbdata)
+        else:
+            self._dbdata = dbdata
+
+    def _load(self, dbdata):
+        self.db_id = dbdata['id']
+        self.tuner_id  = dbdata['tuner_id']
+        self.name = dbdata['name']
+        self.long_name = dbdata['long_name']
+        # User defined position in the channel list or None
+        self.sort_number = dbdata.get('sort_number')
 
     def __getattr__(self, attr):
         """
@@ -44,10 +56,7 @@ class Channel(object):
         defer any ObjectRow unpickling.
         """
         if attr != '_dbdata' and hasattr(self, '_dbdata'):
-            self.db_id = self._dbdata['id']
-            self.tuner_id  = self._dbdata['tuner_id']
-            self.name = self._dbdata['name']
-            self.long_name = self._dbdata['long_name']
+            self._load(self._dbdata)
             del self._dbdata
         return self.__getattribute__(attr)
 
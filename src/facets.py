@@ -0,0 +1,127 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# facets.py - Precomputed genre counts per channel and hour
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+# The genre_counts table holds the number of programs per genre, channel and
+# hour bucket (start time / 3600).  A program is counted in the bucket of its
+# start time.  The table is created and kept up to date by the updater and is
+# only a cache: every range can be recounted from the program table and the
+# genres inverted index.
+
+__all__ = [ 'BUCKET', 'create_table', 'update_counts', 'update_buckets', 'get_counts' ]
+
+#: Length of a bucket in seconds
+BUCKET = 3600
+
+
+def _has_table(db):
+    return bool(db._db_query_row("SELECT name FROM sqlite_master WHERE type='table' AND name='genre_counts'"))
+
+
+def create_table(db):
+    """
+    Create the genre count table if needed.  The counts are computed for
+    all programs if the table is new.
+    """
+    if _has_table(db):
+        return
+    db._db_query('''CREATE TABLE genre_counts (
+                        bucket INTEGER,
+                        channel_id INTEGER,
+                        genre TEXT,
+                        count INTEGER,
+                        PRIMARY KEY (bucket, channel_id, genre))''')
+    update_counts(db)
+    db.commit()
+
+
+def update_counts(db, start=None, stop=None):
+    """
+    Recount the genres of all programs starting within [start, stop].  None
+    means an open range.  The caller has to commit the database.
+    """
+    lo = int(start) // BUCKET if start is not None else -1
+    hi = int(stop) // BUCKET if stop is not None else 2**40
+    db._db_query('DELETE FROM genre_counts WHERE bucket >= ? AND bucket <= ?', (lo, hi))
+    db._db_query('''INSERT INTO genre_counts (bucket, channel_id, genre, count)
+                    SELECT program.start / %d, program.parent_id, terms.term, count(*)
+                      FROM objects_program AS program,
+                           ivtidx_genres_terms_map AS map,
+                           ivtidx_genres_terms AS terms
+                     WHERE program.start >= ? AND program.start < ?
+                       AND map.object_type = ? AND map.object_id = program.id
+                       AND map.term_id = terms.id
+                  GROUP BY 1, 2, 3''' % BUCKET,
+                 (lo * BUCKET, (hi + 1) * BUCKET, db._get_type_id('program')))
+
+
+def update_buckets(db, buckets):
+    """
+    Recount the genres of the given buckets.  Each run of consecutive
+    buckets is recounted with one query.  The caller has to commit the
+    database.
+    """
+    run = None
+    for bucket in sorted(buckets):
+        if run and bucket == run[1] + 1:
+            run[1] = bucket
+            continue
+        if run:
+            update_counts(db, run[0] * BUCKET, run[1] * BUCKET)
+        run = [ bucket, bucket ]
+    if run:
+        update_counts(db, run[0] * BUCKET, run[1] * BUCKET)
+
+
+def get_counts(db, channels=None, start=None, stop=None):
+    """
+    Return a dict genre -> number of programs on the given channel db ids
+    (None for all) starting in [start, stop).  The window is extended to
+    full buckets.  Until the table is created by the first update, the
+    programs are counted directly.
+    """
+    lo = int(start) // BUCKET if start is not None else -1
+    hi = (int(stop) - 1) // BUCKET if stop is not None else 2**40
+    hi = max(lo, hi)
+    ids = None
+    if channels is not None:
+        ids = ','.join(str(int(c)) for c in channels)
+    if not _has_table(db):
+        sql = '''SELECT terms.term, count(*)
+                   FROM objects_program AS program,
+                        ivtidx_genres_terms_map AS map,
+                        ivtidx_genres_terms AS terms
+                  WHERE program.start >= ? AND program.start < ?
+                    AND map.object_type = ? AND map.object_id = program.id
+                    AND map.term_id = terms.id'''
+        if ids is not None:
+            sql += ' AND program.parent_id IN (%s)' % ids
+        return dict(db._db_query(sql + ' GROUP BY 1',
+                                 (lo * BUCKET, (hi + 1) * BUCKET, db._get_type_id('program'))))
+    sql = 'SELECT genre, sum(count) FROM genre_counts WHERE bucket >= ? AND bucket <= ?'
+    if ids is not None:
+        sql += ' AND channel_id IN (%s)' % ids
+    return dict(db._db_query(sql + ' GROUP BY genre', (lo, hi)))
@@ -27,11 +27,16 @@
 #
 # -----------------------------------------------------------------------------
 
-__all__ = [ 'Guide' ]
+__all__ = [ 'Guide', 'SearchCursor' ]
 
 # python imports
 import os
+import time
+import heapq
 import logging
+import threading
+from datetime import datetime
+from collections import OrderedDict
 
 # kaa imports
 import kaa
@@ -41,12 +46,23 @@ import kaa.dateutils
 
 # kaa.epg imports
 from channel import Channel
-from program import Program
-from util import cmp_channel, EPGError
+from program import Program, program_tuple
+from index import IntervalIndex
+from cache import QueryCache
+from planner import Recording, make_tuners, schedule
+from terms import TermIndex
+from stats import QueryStats
+import facets
+import metadata
+from util import channel_sort_key, series_id, EPGError
 
 # get logging object
 log = logging.getLogger('epg')
 
+#: Length of the time slots used to count programs per day.  All timezone
+#: offsets are multiples of 15 minutes, so a slot never spans two local days.
+DAY_SLOT = 900
+
 class Guide(kaa.Object):
     """
     EPG guide with db access.
@@ -66,16 +82,75 @@ class Guide(kaa.Object):
 
             Callbacks can add additional information to the program by adding
             keys to the extra_info dictionary.
+            ''',
+
+        'programs-retrieved':
+            '''
+            Emitted once for all programs retrieved by a query.
+
+            .. describe:: def callback(rows, extra_infos, ...)
+
+               :param rows: the programs that have been retrieved from the database.
+               :type rows: list of dictionary type objects
+
+               :param extra_infos: one dictionary per row to which to add additional info.
+               :type extra_infos: sequence of dictionary objects
+
+            This is the batched variant of program-retrieved.  It is emitted
+            before the per-program signal and allows callbacks to process all
+            rows of a query in one call.  The dictionary of a row is only
+            created when it is accessed by index, so callbacks that mark
+            few rows should use extra_infos[n] rather than iterate.
             '''
     }
 
+    #: Use the in-memory interval index for time queries.  If False, time
+    #: queries fall back to a range query based on the longest program.
+    use_interval_index = True
+
+    #: Minimum number of seconds between two syncs caused by database changes
+    #: of other processes other than a completed update, e.g. the commits of
+    #: the batches of a running update.
+    resync_interval = 30
 
-    def __init__(self, database):
+    def __init__(self, database, cache_size=0, cache_ttl=None, query_threads=0, stats=False, slow_query=None):
+        """
+        :param database: filename of the database
+        :param cache_size: number of search results to keep in a LRU cache;
+                           0 disables the cache
+        :param cache_ttl: maximum age of a cached search result in seconds
+        :param query_threads: number of threads executing searches using their
+                              own read-only database connection; 0 executes
+                              searches in the main thread
+        :param stats: collect query latency statistics, see
+                      :meth:`~Guide.get_stats`
+        :param slow_query: log queries taking at least this number of seconds;
+                           implies stats
+        """
         super(Guide, self).__init__()
         db_dir = os.path.dirname(database)
         if db_dir and not os.path.isdir(db_dir):
             os.makedirs(db_dir)
+        # Changed every time the guide is synced from the database
+        self._generation = 0
+        self._cache = None
+        if cache_size:
+            self._cache = QueryCache(cache_size, cache_ttl)
+        self._stats = None
+        if stats or slow_query is not None:
+            self._stats = QueryStats(slow_query)
+        self._now_next = None
+        self._now_next_timer = kaa.OneShotTimer(self._advance_now_next)
         self._db = Database(database)
+        # Thread pool and thread local read-only databases of the executor mode
+        self._query_pool = None
+        self._readers = threading.local()
+        if query_threads:
+            # In WAL mode readers do not block the updater and vice versa.
+            self._db._db_query('PRAGMA journal_mode=WAL')
+            self._query_pool = kaa.get_thread_pool('kaa.epg::query') or \
+                kaa.register_thread_pool('kaa.epg::query', kaa.ThreadPool(query_threads))
+            self._query_pool.size = max(self._query_pool.size, query_threads)
         # create the db and register objects
         self._db.register_inverted_index('keywords', min = 2, max = 30)
         self._db.register_inverted_index('genres', min = 3, max = 30)
@@ -83,6 +158,8 @@ class Guide(kaa.Object):
             tuner_id = (list, ATTR_SIMPLE),
             name = (unicode, ATTR_SEARCHABLE),
             long_name = (unicode, ATTR_SEARCHABLE),
+            # User defined position in the channel list, overrides the tuner id
+            sort_number = (int, ATTR_SEARCHABLE),
         )
         self._db.register_object_type_attrs("program",
             [ ("start", "stop") ],
@@ -113,7 +190,13 @@ class Guide(kaa.Object):
             # Bitmask for the kaa.epg.Program.FLAG_* constants
             flags = (int, ATTR_SEARCHABLE),
             # List of credits (type, name, role)
-            credits = (list, ATTR_SIMPLE)
+            credits = (list, ATTR_SIMPLE),
+            # Identity of the series and of the program regardless of the
+            # air time, taken from the source or computed by the updater
+            series_id = (unicode, ATTR_SEARCHABLE | ATTR_INDEXED),
+            program_id = (unicode, ATTR_SEARCHABLE | ATTR_INDEXED),
+            # Hash of the title and all attributes, see util.fingerprint()
+            fingerprint = (int, ATTR_SEARCHABLE | ATTR_INDEXED)
         )
         self._sync()
 
@@ -122,15 +205,36 @@ class Guide(kaa.Object):
         """
         Sync cached guide data from database.
         """
-        # Load some basic information from the db, stored as metadata during last update.
-        self._max_program_length = int(self._db.get_metadata('kaa.epg::max_program_length', 0))
-        self._num_programs = int(self._db.get_metadata('kaa.epg::num_programs', 0))
+        # Restore channels and statistics from the snapshot written by the
+        # last update.  If it is missing or stale, load them from the db.
+        snapshot = metadata.read_snapshot(self._db)
+        if snapshot:
+            self._max_program_length = snapshot['max_program_length']
+            self._num_programs = snapshot['num_programs']
+            channels = snapshot['channels']
+        else:
+            # Load some basic information from the db, stored as metadata during last update.
+            self._max_program_length = int(self._db.get_metadata('kaa.epg::max_program_length', 0))
+            self._num_programs = int(self._db.get_metadata('kaa.epg::num_programs', 0))
+            channels = self._db.query(type = "channel")
+        # The interval index, the snapshot and the completion terms are built
+        # on first use.
+        self._index = None
+        self._snapshot = None
+        self._terms = None
+        self._keywords = None
+        self._generation += 1
+        # Commits of other connections change the data version, complete
+        # updates also the generation.
+        self._data_version = self._db._db_query_row('PRAGMA data_version')[0]
+        self._db_generation = metadata.get_generation(self._db)
+        self._synced = time.time()
 
         # Build channel mappings (keyed by name, db id, and tuner id)
         self._channels_by_name = {}
         self._channels_by_db_id = {}
         self._channels_by_tuner_id = {}
-        for objrow in self._db.query(type = "channel"):
+        for objrow in channels:
             chan = Channel(objrow)
             self._channels_by_name[chan.name] = chan
             self._channels_by_db_id[chan.db_id] = chan
@@ -140,6 +244,130 @@ class Guide(kaa.Object):
                                 chan.name, t, self._channels_by_tuner_id[t].name)
                 else:
                     self._channels_by_tuner_id[t] = chan
+        self._sort_channels()
+        # The now/next table is built on first use.
+        self._now_next = None
+        self._now_next_timer.stop()
+
+    def _check_changed(self):
+        """
+        Sync the guide if the database was changed by another process since
+        the last sync, so the interval index, the now/next table and the
+        cached results are not used anymore.  Updates done by this guide
+        call _sync() themselves.
+
+        A complete update is synced at once.  For other changes, e.g. while
+        an update is running, the guide is synced at most every
+        resync_interval seconds, as rebuilding the interval index reads the
+        whole program table.
+        """
+        if self._db._db_query_row('PRAGMA data_version')[0] == self._data_version:
+            return
+        if metadata.get_generation(self._db) != self._db_generation:
+            log.info('database updated by another process, syncing')
+            self._sync()
+        elif time.time() >= self._synced + self.resync_interval:
+            log.info('database changed by another process, syncing')
+            self._sync()
+
+    def _sort_channels(self):
+        """
+        Build the sorted channel list returned by get_channels(sort=True).
+        """
+        self._channels_sorted = sorted(self._channels_by_name.values(), key=channel_sort_key)
+
+    def _update_now_next(self, channels=None):
+        """
+        Update the now/next table for the given channel db ids (or all
+        channels if None) and schedule the timer for the next program change.
+        """
+        now = int(time.time())
+        if channels is None:
+            self._now_next = {}
+            channels = self._channels_by_db_id.keys()
+        index = self._get_index()
+        entries = {}
+        for channel_db_id in channels:
+            programs = index.programs(channel_db_id, now + 1, None, limit=2)
+            if programs and programs[0][0] > now:
+                # Nothing is running right now, only the next program is known.
+                programs.insert(0, None)
+            entries[channel_db_id] = (programs + [ None, None ])[:2]
+        ids = [ p[2] for programs in entries.values() for p in programs if p ]
+        rows = self._query_ids(ids) if ids else []
+        extra_data = self._emit_retrieved(rows)
+        info = {}
+        for i, row in enumerate(rows):
+            info[row['id']] = row, extra_data[i] if extra_data else None
+        for channel_db_id, programs in entries.items():
+            self._now_next[channel_db_id] = tuple(info.get(p[2]) if p else None for p in programs)
+        # Wake up at the next program boundary
+        changes = []
+        for current, next in self._now_next.values():
+            if current:
+                changes.append(current[0]['stop'])
+            elif next:
+                changes.append(next[0]['start'])
+        self._now_next_timer.stop()
+        if changes:
+            self._now_next_timer.start(max(min(changes) - time.time(), 0))
+
+    def _advance_now_next(self):
+        """
+        Timer callback to move the now/next table forward in time.
+        """
+        if self._now_next is None:
+            return
+        now = time.time()
+        expired = []
+        for channel_db_id, (current, next) in self._now_next.items():
+            if (current and current[0]['stop'] <= now) or (next and next[0]['start'] <= now):
+                expired.append(channel_db_id)
+        self._update_now_next(expired)
+
+    def _get_index(self):
+        """
+        Return the interval index of all programs, building it if needed.
+        """
+        if self._index is None:
+            generation = self._generation
+            rows = self._reader()._db_query('''SELECT parent_id, start, stop, id
+                                           FROM objects_program
+                                       ORDER BY parent_id, start''')
+            index = IntervalIndex(rows)
+            if generation != self._generation:
+                # Synced while the index was built in a query thread
+                return index
+            self._index = index
+        return self._index
+
+    def _get_snapshot(self, start, stop):
+        """
+        Return the snapshot for the given window, reusing the last one if
+        the guide has not been synced since.
+        """
+        key = self._generation, start, stop
+        if self._snapshot and self._snapshot[0] == key:
+            return self._snapshot[1]
+        try:
+            from snapshot import Snapshot
+        except ImportError:
+            raise EPGError('numpy is required for snapshot_arrays')
+        snapshot = Snapshot.from_index(self._get_index(), self.get_channels(sort=True), start, stop)
+        self._snapshot = key, snapshot
+        return snapshot
+
+    def _query_ids(self, ids, **kwargs):
+        """
+        Query programs by db id.  The ids are split into chunks to stay below
+        the SQLite limit of variables per statement.
+        """
+        results = []
+        for pos in range(0, len(ids), 500):
+            results.extend(self._reader().query(type='program', id=QExpr('in', ids[pos:pos+500]), **kwargs))
+        if kwargs.get('limit'):
+            del results[kwargs['limit']:]
+        return results
 
     @kaa.coroutine()
     def search(self, channel=None, time=None, cls=Program, **kwargs):
@@ -189,13 +417,261 @@ class Guide(kaa.Object):
 
         With the exception of ``keywords`` and ``genres``, a :class:`~kaa.db.QExpr`
         object can be used with any of the above kwargs.
+
+        The result can be paged with ``limit`` and ``offset``.  ``order_by``
+        sorts the result by ``start``, ``title`` or ``channel``; it defaults to
+        ``start`` if an offset is given.  For large results see
+        :meth:`~Guide.iter_search`.
+
+        If ``attrs`` is given as a list of attribute names, only these columns
+        are fetched from the database and the result is a list of named
+        tuples with the fields ``channel`` followed by the requested
+        attributes.  Simple attributes such as ``credits`` or ``genres`` are
+        only unpickled if requested.  The program-retrieved signal is not
+        emitted for such queries.
+
+        If ``fill_gaps`` is True, the times within the searched time range
+        where a channel has no program at all (e.g. a channel off air at
+        night or a guide ending early) are included as placeholder programs
+        with ``valid`` set to False.  A placeholder reaches from the end of
+        the previous program to the start of the next one.  This requires a
+        time and ``order_by`` ``start`` (the default) or ``channel``.
+        """
+        self._check_changed()
+        attrs = kwargs.get('attrs')
+        if attrs:
+            # The channel is always needed to build the result tuples, the
+            # times to merge the rows with the gaps.
+            needed = [ 'parent_id', 'start', 'stop' ] if kwargs.get('fill_gaps') else [ 'parent_id' ]
+            kwargs['attrs'] = list(attrs) + [ a for a in needed if a not in attrs ]
+
+        channels, start, stop = self._normalize_query(channel, time)
+        measure = self._measure('search', channels, start, stop, kwargs)
+        order_by = kwargs.pop('order_by', None)
+        offset = kwargs.pop('offset', 0)
+        if offset and not order_by:
+            # An offset is useless without a defined order.
+            order_by = 'start'
+        if kwargs.get('fill_gaps'):
+            if start is None:
+                raise ValueError('fill_gaps requires a time')
+            order_by = order_by or 'start'
+            if order_by not in ('start', 'channel'):
+                raise ValueError('Invalid order_by %s for fill_gaps' % order_by)
+
+        query_data = key = None
+        if self._cache is not None:
+            key = self._cache.make_key(channels, start, stop, dict(kwargs, order_by=order_by, offset=offset))
+            query_data = self._cache.get(key, self._generation)
+        if query_data is None:
+            generation = self._generation
+            query_data = yield self._execute(self._search, channels, start, stop, order_by, offset, **kwargs)
+            # Do not cache results of a query running while the guide was synced.
+            if key is not None and generation == self._generation:
+                self._cache.put(key, generation, query_data)
+        if key is not None:
+            # Use a copy, the cached list must not be modified.
+            query_data = list(query_data)
+        if measure is not None:
+            measure.queried()
+
+        extra_data = self._emit_retrieved(query_data) if not attrs else None
+        if cls is None:
+            # return raw data:
+            result = query_data, extra_data
+        elif attrs:
+            # Projection: only return the requested attributes.
+            result = self._rows_to_tuples(attrs, query_data)
+        else:
+            # Convert raw search result data from the server into python objects.
+            result = self._rows_to_programs(cls, query_data, extra_data)
+        if measure is not None:
+            measure.done(len(query_data))
+        yield result
+
+    @kaa.coroutine()
+    def search_ids(self, channel=None, time=None, order_by='start', **kwargs):
         """
+        Search the EPG and return the db ids of the matching programs.
+
+        Takes the same arguments as :meth:`~Guide.search`, but only the
+        columns needed for sorting are fetched from the database.  Use
+        :meth:`~Guide.get_programs` to get the programs for the ids.
+        ``fill_gaps`` is not supported, placeholders have no db id.
+        """
+        if kwargs.get('fill_gaps'):
+            raise ValueError('fill_gaps is not supported by search_ids')
+        channels, start, stop = self._normalize_query(channel, time)
+        offset = kwargs.pop('offset', 0)
+        limit = kwargs.pop('limit', None)
+        ids = yield self._execute(self._search_ids, channels, start, stop, order_by, **kwargs)
+        yield ids[offset:offset+limit if limit else None]
+
+    @kaa.coroutine()
+    def get_programs(self, ids, cls=Program, attrs=None):
+        """
+        Get programs by their db ids.
+
+        :param ids: list of program db ids, e.g. from :meth:`~Guide.search_ids`
+        :param cls: Class used for program results.  If None is given, the
+                    raw query data (from kaa.db) is returned.
+        :param attrs: list of attribute names to fetch, the result is a list
+                      of named tuples as for :meth:`~Guide.search`
+        :return: a list of programs in the order of ids
+        """
+        kwargs = {}
+        if attrs:
+            # The channel is always needed to build the result tuples.
+            kwargs['attrs'] = list(attrs) + [ a for a in [ 'parent_id' ] if a not in attrs ]
+        query_data = yield self._execute(self._get_rows, ids, **kwargs)
+        extra_data = self._emit_retrieved(query_data) if not attrs else None
+        if cls is None:
+            # return raw data:
+            yield query_data, extra_data
+        if attrs:
+            yield self._rows_to_tuples(attrs, query_data)
+        yield self._rows_to_programs(cls, query_data, extra_data)
+
+    @kaa.coroutine()
+    def iter_search(self, channel=None, time=None, cls=Program, chunk_size=100, **kwargs):
+        """
+        Search the EPG for programs and return a :class:`SearchCursor`.
+
+        Takes the same arguments as :meth:`~Guide.search` except
+        ``fill_gaps``.  Only the sorted program ids are fetched first; the
+        programs, or the named tuples if ``attrs`` is given, are fetched in
+        chunks of chunk_size using :meth:`SearchCursor.fetch`::
+
+            cursor = yield guide.iter_search(keywords=u'news')
+            while True:
+                programs = yield cursor.fetch()
+                if not programs:
+                    break
+
+        The list of all matching ids is kept in memory by the cursor, it is
+        only the program data that is fetched in chunks.
+        """
+        attrs = kwargs.pop('attrs', None)
+        ids = yield self.search_ids(channel, time, **kwargs)
+        yield SearchCursor(self, ids, cls, chunk_size, attrs)
+
+    @kaa.coroutine()
+    def count(self, channel=None, time=None, count_by=None, **kwargs):
+        """
+        Count the programs matching a search.
+
+        Takes the same arguments as :meth:`~Guide.search`.  ``order_by``,
+        ``offset``, ``limit`` and ``attrs`` are ignored, the result is the
+        total number of matches, e.g. to compute the number of pages.
+        ``fill_gaps`` is not supported, placeholders are not counted.
+
+        :param count_by: None to count all matches, or ``channel``, ``genre``
+                         or ``day`` to count the matches per channel, genre or
+                         local day of the program start.
+        :return: the number of matching programs, or if count_by is given, a
+                 dict mapping :class:`~kaa.epg.Channel` objects, genres or
+                 :class:`datetime.date` objects to the number of matches.
+
+        No program objects are created.  Depending on the query the result
+        is computed using SQL aggregates, the interval index or a query of
+        the id columns only.
+        """
+        channels, start, stop = self._normalize_query(channel, time)
+        result = yield self._execute(self._count, channels, start, stop, count_by, **kwargs)
+        yield self._count_result(count_by, result)
+
+    def _count(self, channels, start, stop, count_by=None, **kwargs):
+        """
+        Count the programs on the given channel db ids intersecting with
+        [start, stop].  Counts per channel are keyed on the channel db id,
+        counts per day on the DAY_SLOT of the program start.  The slots are
+        converted to local days by _count_result, so an RPC client gets the
+        days of its own timezone.
+        """
+        if count_by not in (None, 'channel', 'genre', 'day'):
+            raise ValueError('Invalid count_by %s' % count_by)
+        if kwargs.get('fill_gaps'):
+            raise ValueError('fill_gaps is not supported by count')
+        for key in ('order_by', 'offset', 'limit', 'attrs'):
+            # They do not change the number of matches.
+            kwargs.pop(key, None)
+        db = self._reader()
+        if not kwargs and start is None:
+            # Plain aggregates over the program table
+            where = ''
+            if channels is not None:
+                where = 'WHERE parent_id IN (%s)' % ','.join(str(int(c)) for c in channels)
+            if count_by == 'genre' and channels is None:
+                return dict(db._db_query('SELECT term, count FROM ivtidx_genres_terms WHERE count > 0'))
+            if count_by in (None, 'channel'):
+                rows = db._db_query('''SELECT parent_id, count(*)
+                                               FROM objects_program %s
+                                           GROUP BY parent_id''' % where)
+                return dict(rows) if count_by else sum(r[1] for r in rows)
+            entries = db._db_query('SELECT parent_id, start, id FROM objects_program %s' % where)
+        elif not kwargs and self.use_interval_index:
+            # Time window only, no need to query the db to get the matches.
+            index = self._get_index()
+            entries = []
+            for channel_db_id in (channels if channels is not None else index.channels()):
+                for p in index.programs(channel_db_id, start, stop if stop > 0 else None):
+                    entries.append((channel_db_id, p[0], p[2]))
+        else:
+            rows = self._query_programs(channels, start, stop, attrs=[ 'parent_id', 'start' ], **kwargs)
+            entries = [ (r['parent_id'], r['start'], r['id']) for r in rows ]
+
+        result = {}
+        if count_by is None:
+            return len(entries)
+        if count_by == 'channel':
+            for channel_db_id, start, program_db_id in entries:
+                result[channel_db_id] = result.get(channel_db_id, 0) + 1
+        elif count_by == 'day':
+            for channel_db_id, start, program_db_id in entries:
+                slot = start // DAY_SLOT
+                result[slot] = result.get(slot, 0) + 1
+        elif count_by == 'genre':
+            ids = [ e[2] for e in entries ]
+            type_id = db._get_type_id('program')
+            for pos in range(0, len(ids), 500):
+                rows = db._db_query('''SELECT terms.term, count(*)
+                                               FROM ivtidx_genres_terms_map AS map, ivtidx_genres_terms AS terms
+                                              WHERE map.object_type=? AND map.object_id IN (%s) AND
+                                                    terms.id = map.term_id
+                                           GROUP BY terms.term''' % ','.join(str(i) for i in ids[pos:pos+500]),
+                                          (type_id,))
+                for term, count in rows:
+                    result[term] = result.get(term, 0) + count
+        return result
+
+    def _count_result(self, count_by, result):
+        if count_by == 'day':
+            days = {}
+            for slot, count in result.items():
+                day = datetime.fromtimestamp(slot * DAY_SLOT, kaa.dateutils.local).date()
+                days[day] = days.get(day, 0) + count
+            return days
+        if count_by != 'channel':
+            return result
+        channels = {}
+        for channel_db_id, count in result.items():
+            if channel_db_id in self._channels_by_db_id:
+                channels[self._channels_by_db_id[channel_db_id]] = count
+        return channels
+
+    def _normalize_query(self, channel, time):
+        """
+        Convert the channel and time arguments of a search into a list of
+        channel db ids (or None) and the start and stop timestamp (or None).
+        """
+        channels = None
         if channel is not None:
             if isinstance(channel, Channel):
-                kwargs["parent"] = "channel", channel.db_id
+                channels = [ channel.db_id ]
             if isinstance(channel, (tuple, list)):
-                kwargs["parent"] = [ ("channel", c.db_id) for c in channel ]
+                channels = [ c.db_id for c in channel ]
 
+        start = stop = None
         if time is not None:
             # Find all programs currently playing at (or within) the given
             # time(s).  We push in the boundaries by 1 second as a heuristic to
@@ -203,40 +679,489 @@ class Guide(kaa.Object):
             # 2 programs.  e.g. if program A ends at 15:00 and B starts at 15:00,
             # searching for start=15:00 should return B and not A.
             if isinstance(time, (tuple, list)):
-                start, stop = to_timestamp(time[0]) + 1, to_timestamp(time[1]) - 1
+                start, stop = int(to_timestamp(time[0]) + 1), int(to_timestamp(time[1]) - 1)
             else:
-                start = stop = to_timestamp(time) + 1
-            
+                start = stop = int(to_timestamp(time) + 1)
+        return channels, start, stop
+
+    def _reader(self):
+        """
+        Return the database to query: the read-only database of the current
+        query thread or the main database.
+        """
+        db = getattr(self._readers, 'db', None)
+        return db if db is not None else self._db
+
+    def _execute(self, func, *args, **kwargs):
+        """
+        Call func in the query thread pool, or in the current thread if the
+        executor mode is disabled.  The queries in func must use
+        :meth:`_reader` to get the database.
+
+        :return: :class:`~kaa.InProgress` finished with the result of func
+        """
+        self._check_changed()
+        if self._query_pool is None:
+            return kaa.InProgress().execute(func, *args, **kwargs)
+        return kaa.ThreadPoolCallable(self._query_pool, self._execute_threaded, func, *args, **kwargs)()
+
+    def _execute_threaded(self, func, *args, **kwargs):
+        """
+        Call func in a query thread, opening the read-only database of the
+        thread on first use.
+        """
+        if getattr(self._readers, 'db', None) is None:
+            db = Database(self._db._dbfile)
+            db._db_query('PRAGMA query_only=ON')
+            self._readers.db = db
+        return func(*args, **kwargs)
+
+    def _search(self, channels, start, stop, order_by=None, offset=0, fill_gaps=False, **kwargs):
+        """
+        Return the rows of a search, see :meth:`search`.
+        """
+        if fill_gaps:
+            limit = kwargs.pop('limit', None)
+            rows = self._search_gaps(channels, start, stop, order_by, **kwargs)
+            return rows[offset:offset+limit if limit else None]
+        if order_by:
+            limit = kwargs.pop('limit', None)
+            ids = self._search_ids(channels, start, stop, order_by, **kwargs)
+            return self._get_rows(ids[offset:offset+limit if limit else None], **kwargs)
+        return self._query_programs(channels, start, stop, **kwargs)
+
+    def _search_ids(self, channels, start, stop, order_by='start', **kwargs):
+        """
+        Return the db ids of all matching programs sorted by order_by.  Only
+        the columns needed for sorting are fetched from the database.
+        """
+        kwargs['attrs'] = [ 'parent_id', 'start', 'title' ]
+        kwargs.pop('limit', None)
+        rows = self._query_programs(channels, start, stop, **kwargs)
+        if order_by == 'start':
+            rows.sort(key=lambda r: (r['start'], r['parent_id']))
+        elif order_by == 'title':
+            rows.sort(key=lambda r: (r['title'], r['start']))
+        elif order_by == 'channel':
+            rank = dict((c.db_id, n) for n, c in enumerate(self.get_channels(sort=True)))
+            rows.sort(key=lambda r: (rank.get(r['parent_id']), r['start']))
+        else:
+            raise ValueError('Invalid order_by %s' % order_by)
+        return [ r['id'] for r in rows ]
+
+    def _search_gaps(self, channels, start, stop, order_by='start', **kwargs):
+        """
+        Return the rows of all matching programs together with placeholder
+        rows for the gaps of the channels, sorted by order_by.  Programs and
+        gaps of a channel are taken from the interval index in start order,
+        so the channels only need to be merged.
+        """
+        rank = dict((c.db_id, n) for n, c in enumerate(self.get_channels(sort=True)))
+        if channels is None:
+            channels = rank.keys()
+        channels = sorted(channels, key=rank.get)
+        results = self._index_rows(channels, start, stop if stop > 0 else None, True, **kwargs)
+        if order_by == 'channel':
+            return [ row for channel_db_id, channel_rows in results for row in channel_rows ]
+        # Ordered by start and parent id like _search_ids
+        merged = heapq.merge(*[ [ (r['start'], r['parent_id'], n, pos, r) for pos, r in enumerate(channel_rows) ]
+                                for n, (channel_db_id, channel_rows) in enumerate(results) ])
+        return [ r[-1] for r in merged ]
+
+    def _index_rows(self, channels, start, stop, gaps=False, **kwargs):
+        """
+        Return a (channel db id, rows) tuple for each of the given channel db
+        ids, where rows are the programs intersecting with [start, stop] in
+        the order of the interval index.  If gaps is True, placeholder rows
+        for the gaps are included.
+        """
+        index = self._get_index()
+        entries = [ (c, index.programs(c, start, stop, gaps=gaps)) for c in channels ]
+        ids = [ p[2] for c, programs in entries for p in programs if p[2] is not None ]
+        rows = {}
+        if ids and not self._use_index(start, kwargs):
+            # Filter with one db query, only the order is taken from the index.
+            for row in self._query_programs(channels, start, stop, **kwargs):
+                rows[row['id']] = row
+        elif ids:
+            for row in self._query_ids(ids, **kwargs):
+                rows[row['id']] = row
+        results = []
+        for channel_db_id, programs in entries:
+            channel_rows = []
+            for program_start, program_stop, program_db_id in programs:
+                if program_db_id is None:
+                    channel_rows.append(self._gap_row(channel_db_id, program_start, program_stop))
+                elif program_db_id in rows:
+                    channel_rows.append(rows[program_db_id])
+            results.append((channel_db_id, channel_rows))
+        return results
+
+    def _gap_row(self, channel_db_id, start, stop):
+        """
+        Return a placeholder row for a time without programs on a channel.
+        Its id is None.
+        """
+        return { 'type': 'program', 'id': None, 'parent_id': channel_db_id, 'start': start, 'stop': stop }
+
+    def _get_rows(self, ids, **kwargs):
+        """
+        Query programs by db id and return them in the order of ids.
+        """
+        rows = {}
+        if ids:
+            for row in self._query_ids(ids, **kwargs):
+                rows[row['id']] = row
+        return [ rows[i] for i in ids if i in rows ]
+
+    def _use_index(self, start, kwargs):
+        """
+        Return True if the programs of a query are found using the interval
+        index: a time is given and kwargs have no filters.  Filtered queries,
+        especially using an inverted index, are faster and keep their order
+        as one db query.
+        """
+        return start is not None and self.use_interval_index and \
+               not [ k for k in kwargs if k not in ('attrs', 'limit') ]
+
+    def _query_programs(self, channels, start, stop, **kwargs):
+        """
+        Query the programs on the given channel db ids intersecting with
+        [start, stop].  The time is not used if start is None.
+        """
+        if self._use_index(start, kwargs):
+            # Resolve the time window to program ids using the interval
+            # index and only fetch those programs from the db.
+            ids = self._get_index().find(channels, start, stop if stop > 0 else None)
+            return self._query_ids(ids, **kwargs) if ids else []
+        if channels is not None:
+            kwargs["parent"] = [ ("channel", c) for c in channels ]
+        if start is not None:
             if stop > 0:
-                kwargs["start"] = QExpr("range", (int(start) - self._max_program_length, int(stop)))
-                kwargs["stop"]  = QExpr(">=", int(start))
+                kwargs["start"] = QExpr("range", (start - self._max_program_length, stop))
+                kwargs["stop"]  = QExpr(">=", start)
             else:
-                kwargs["start"] = QExpr(">=", (int(start) - self._max_program_length))
-
-        query_data = self._db.query(type='program', **kwargs)
-        # Convert raw search result data
-        if kwargs.get('attrs'):
-            attrs = kwargs.get('attrs')
-            def combine_attrs(row):
-                return [ row.get(a) for a in attrs ]
-            [ combine_attrs(row) for row in query_data ]
-
-        if len(self.signals['program-retrieved']):
-            extra_data = []
-            for row in query_data:
-                extra_info = {}
-                self.signals['program-retrieved'].emit(row, extra_info)
-                extra_data.append(extra_info)
-        else:
-            extra_data = None
+                kwargs["start"] = QExpr(">=", (start - self._max_program_length))
+        return self._reader().query(type='program', **kwargs)
+
+    @kaa.coroutine()
+    def get_grid(self, channels, start, stop, cls=Program, fill_gaps=False):
+        """
+        Get the programs of several channels within a time window.
 
+        :param channels: the channels of the grid
+        :type channels: list of :class:`~kaa.epg.Channel` objects
+        :param start: start of the time window
+        :param stop: end of the time window
+        :type start: int or float, datetime
+        :type stop: int or float, datetime
+        :param cls: Class used for program results.  If None is given, a list
+                    of (channel db id, rows, extra_data) tuples is returned.
+        :param fill_gaps: if True, times without programs are included as
+                          placeholder programs, see :meth:`~Guide.search`.
+        :return: an ordered dict mapping each channel to the list of programs
+                 intersecting with the time window, sorted by start time.
+
+        Unlike :meth:`~Guide.search` all programs are fetched in one pass
+        and the order is taken from the interval index, so no sorting is
+        needed to build the grid.
+        """
+        self._check_changed()
+        # Same boundary heuristic as used in search()
+        start, stop = int(to_timestamp(start)) + 1, int(to_timestamp(stop)) - 1
+        grid = self._index_rows([ c.db_id for c in channels ], start, stop, fill_gaps)
+        query_data = [ row for channel_db_id, channel_rows in grid for row in channel_rows ]
+        extra_data = self._emit_retrieved(query_data)
+        result = []
+        pos = 0
+        for channel_db_id, channel_rows in grid:
+            channel_extra = extra_data[pos:pos+len(channel_rows)] if extra_data else None
+            result.append((channel_db_id, channel_rows, channel_extra))
+            pos += len(channel_rows)
         if cls is None:
             # return raw data:
-            yield query_data, extra_data
+            yield result
+        yield self._rows_to_grid(cls, result)
 
-        # Convert raw search result data from the server into python objects.
+    @kaa.coroutine()
+    def get_now_next(self, channels=None, cls=Program):
+        """
+        Get the currently running and the next program of channels.
+
+        :param channels: a channel, a list of channels or None for all channels
+        :type channels: :class:`~kaa.epg.Channel` object, list, or None
+        :param cls: Class used for program results.  If None is given, a list
+                    of (channel db id, now, next) tuples is returned with now
+                    and next being (row, extra_info) tuples or None.
+        :return: an ordered dict mapping each channel to a (now, next) tuple
+                 of programs.  Each of them may be None if unknown.
+
+        The result is taken from a table kept in memory and updated when a
+        program ends, so no database access is needed.
+        """
+        self._check_changed()
+        if channels is None:
+            channels = self._channels_by_db_id.values()
+        elif isinstance(channels, Channel):
+            channels = [ channels ]
+        if self._now_next is None:
+            self._update_now_next()
+        result = [ (c.db_id,) + tuple(self._now_next.get(c.db_id, (None, None))) for c in channels ]
+        if cls is None:
+            # return raw data:
+            yield result
+        yield self._rows_to_now_next(cls, result)
+
+    @kaa.coroutine()
+    def get_airings(self, program, cls=Program):
+        """
+        Return all airings of a program on all channels.
+
+        :param program: the program or its program_id
+        :type program: :class:`~kaa.epg.Program` object or unicode
+        :return: list of :class:`~kaa.epg.Program` objects sorted by start time
+        """
+        if isinstance(program, Program):
+            program = program.program_id
+        if not program:
+            yield []
+        yield (yield self.search(program_id=program, cls=cls, order_by='start'))
+
+    @kaa.coroutine()
+    def get_series(self, title, cls=Program):
+        """
+        Return all programs of a series on all channels.
+
+        :param title: the title of the series or one of its programs
+        :type title: unicode or :class:`~kaa.epg.Program` object
+        :return: list of :class:`~kaa.epg.Program` objects sorted by start time
+
+        If a title is given, the programs with the series id computed from it
+        and the programs with exactly this title, which covers series with
+        an id from the guide source, are found with one query.
+        """
+        query = self._series_query(title)
+        if not query:
+            yield []
+        query_data, extra_data = yield self._series_rows(query)
+        if cls is None:
+            # return raw data:
+            yield query_data, extra_data
         yield self._rows_to_programs(cls, query_data, extra_data)
 
+    def _series_query(self, title):
+        """
+        Return the kaa.db query arguments for the programs of a series, or
+        None if the program has no series id.
+        """
+        if isinstance(title, Program):
+            return dict(series_id=title.series_id) if title.series_id else None
+        return dict(series_id=series_id(title), title=title, orattrs=[ 'series_id', 'title' ])
+
+    @kaa.coroutine()
+    def _series_rows(self, query):
+        """
+        Return the rows of the programs of a series sorted by start time and
+        their extra data.
+        """
+        query_data = yield self._execute(self._get_series, query)
+        yield query_data, self._emit_retrieved(query_data)
+
+    def _get_series(self, query):
+        rows = self._reader().query(type='program', **query)
+        rows.sort(key=lambda r: (r['start'], r['parent_id']))
+        return rows
+
+    @kaa.coroutine()
+    def snapshot_arrays(self, start=None, stop=None):
+        """
+        Export all programs of a time window as parallel numpy arrays.
+
+        :param start: start of the window or None for the beginning of the guide
+        :param stop: end of the window or None for the end of the guide
+        :type start: int or float, datetime, or None
+        :type stop: int or float, datetime, or None
+        :return: :class:`~kaa.epg.snapshot.Snapshot` object
+
+        The snapshot holds the channel index, start, stop and program db id
+        of every program intersecting with the window and offers vectorized
+        lookups for many points in time.  It is kept until the guide is
+        updated, so the same window is only exported once.  This function
+        requires numpy.
+        """
+        self._check_changed()
+        if start is not None:
+            start = to_timestamp(start)
+        if stop is not None:
+            stop = to_timestamp(stop)
+        yield self._get_snapshot(start, stop)
+
+    @kaa.coroutine()
+    def plan_recordings(self, requests, tuners=1, padding=0, cls=Program):
+        """
+        Find the programs matching the given recording requests and assign
+        them to tuners, resolving conflicts.
+
+        :param requests: list of dicts with the arguments of a
+                         :meth:`~Guide.search`, including ``channel`` and
+                         ``time``.  An optional ``priority`` key (default 0)
+                         gives precedence to a request; requests with a
+                         higher priority are scheduled first.
+        :param tuners: number of tuners that can receive all channels, or a
+                       dict mapping a tuner name to the list of tuner ids it
+                       can receive (or None for all channels)
+        :type tuners: int or dict
+        :param padding: seconds to add before and after each recording
+        :param cls: class used for the programs; None returns raw db rows,
+                    request indexes and a dict of extra info
+        :return: tuple (scheduled, conflicts) of lists of
+                 :class:`~kaa.epg.planner.Recording` named tuples sorted by
+                 start time.  Conflicts have no tuner assigned.
+
+        Programs that have already ended are ignored unless a request has a
+        ``time``.  A program matched by several requests is planned once for
+        the request with the highest priority, or the first one in the list.
+        Requests that only give a ``title`` are resolved with a single query.
+        """
+        self._check_changed()
+        scheduled, conflicts, extra_data = self._plan_recordings(requests, tuners, padding)
+        if cls is None:
+            yield scheduled, conflicts, extra_data
+        yield self._recordings_to_programs(cls, requests, scheduled, conflicts, extra_data)
+
+    def _plan_recordings(self, requests, tuners, padding):
+        """
+        Plan the recordings and return (scheduled, conflicts) with raw db
+        rows as programs and a dict of extra info keyed by program db id.
+        """
+        now = int(time.time())
+        # Matching rows per request
+        results = {}
+        titles = {}
+        for request, kwargs in enumerate(requests):
+            kwargs = dict(kwargs)
+            kwargs.pop('priority', None)
+            if kwargs.keys() == ['title'] and isinstance(kwargs['title'], basestring):
+                titles.setdefault(kwargs['title'], []).append(request)
+                continue
+            channels, start, stop = self._normalize_query(kwargs.pop('channel', None), kwargs.pop('time', None))
+            results[request] = self._query_planned(channels, start or now, stop, **kwargs)
+        if titles:
+            for request in sum(titles.values(), []):
+                results[request] = []
+            for row in self._query_planned(None, now, None, title=QExpr('in', titles.keys())):
+                for request in titles.get(row['title'], ()):
+                    results[request].append(row)
+        # Best request per program db id and the matching row
+        matches = {}
+        for request in sorted(results.keys()):
+            priority = requests[request].get('priority', 0)
+            for row in results[request]:
+                if row['id'] not in matches or priority > requests[matches[row['id']][0]].get('priority', 0):
+                    matches[row['id']] = request, row
+
+        candidates = []
+        for program_db_id, (request, row) in matches.items():
+            channel = self._channels_by_db_id.get(row['parent_id'])
+            if channel is not None:
+                candidates.append((row['start'] - padding, row['stop'] + padding,
+                                   requests[request].get('priority', 0), channel.tuner_id,
+                                   (program_db_id, request)))
+        scheduled, conflicts = schedule(candidates, make_tuners(tuners))
+
+        # Fetch all attributes of the planned programs.
+        rows = self._get_rows(sorted(matches.keys()))
+        extra_data = self._emit_retrieved(rows)
+        extra_data = dict(zip([ row['id'] for row in rows ], extra_data)) if extra_data else {}
+        rows = dict((row['id'], row) for row in rows)
+        scheduled = [ Recording(rows[c[4][0]], c[4][1], tuner, c[0], c[1]) for c, tuner in scheduled ]
+        conflicts = [ Recording(rows[c[4][0]], c[4][1], None, c[0], c[1]) for c in conflicts ]
+        scheduled.sort(key=lambda r: (r.start, r.tuner))
+        conflicts.sort(key=lambda r: r.start)
+        return scheduled, conflicts, extra_data
+
+    def _query_planned(self, channels, start, stop, **kwargs):
+        """
+        Return the rows with the columns needed for planning of all programs
+        matching kwargs intersecting with [start, stop].
+        """
+        if channels is not None:
+            kwargs['parent'] = [ ('channel', c) for c in channels ]
+        if stop > 0:
+            kwargs.setdefault('start', QExpr('<=', stop))
+        kwargs.setdefault('stop', QExpr('>=', start))
+        return self._db.query(type='program', attrs=['parent_id', 'start', 'stop', 'title'], **kwargs)
+
+    def _recordings_to_programs(self, cls, requests, scheduled, conflicts, extra_data):
+        result = []
+        for recordings in scheduled, conflicts:
+            programs = []
+            for r in recordings:
+                channel = self._channels_by_db_id[r.program['parent_id']]
+                program = cls(channel, r.program, extra_data.get(r.program['id']))
+                programs.append(r._replace(program=program, request=requests[r.request]))
+            result.append(programs)
+        return tuple(result)
+
+    def _rows_to_now_next(self, cls, now_next):
+        result = OrderedDict()
+        for channel_db_id, current, next in now_next:
+            if channel_db_id in self._channels_by_db_id:
+                channel = self._channels_by_db_id[channel_db_id]
+                result[channel] = tuple(cls(channel, p[0], p[1]) if p else None for p in (current, next))
+        return result
+
+    def _emit_retrieved(self, query_data):
+        """
+        Emit programs-retrieved and program-retrieved for the given rows and
+        return the list of extra_info dicts, or None if no callback added
+        any info.  Rows without extra info get None instead of a dict.
+        """
+        batched = self.signals['programs-retrieved']
+        single = self.signals['program-retrieved']
+        if not len(batched) and not len(single):
+            return None
+        rows, positions = query_data, None
+        if any(row['id'] is None for row in query_data):
+            # Placeholders of gaps are not passed to the callbacks.
+            positions = [ i for i, row in enumerate(query_data) if row['id'] is not None ]
+            rows = [ query_data[i] for i in positions ]
+        extra_infos = ExtraInfos(len(rows))
+        if len(batched) and rows:
+            batched.emit(rows, extra_infos)
+        if len(single):
+            # Only per-row callbacks need a dict for every row.
+            for n, row in enumerate(rows):
+                single.emit(row, extra_infos[n])
+        infos = extra_infos.infos
+        if not any(infos):
+            return None
+        if positions is None:
+            return infos
+        extra_data = [ None ] * len(query_data)
+        for i, info in zip(positions, infos):
+            extra_data[i] = info
+        return extra_data
+
+    def _rows_to_grid(self, cls, grid):
+        result = OrderedDict()
+        for channel_db_id, query_data, extra_data in grid:
+            if channel_db_id in self._channels_by_db_id:
+                channel = self._channels_by_db_id[channel_db_id]
+                result[channel] = self._rows_to_programs(cls, query_data, extra_data)
+        return result
+
+    def _rows_to_tuples(self, attrs, query_data):
+        cls = program_tuple(attrs)
+        results = []
+        for row in query_data:
+            if row['parent_id'] in self._channels_by_db_id:
+                channel = self._channels_by_db_id[row['parent_id']]
+            else:
+                continue
+            results.append(cls(channel, *[ row.get(a) for a in attrs ]))
+        return results
+
     def _rows_to_programs(self, cls, query_data, extra_data):
         results = []
         for i,row in enumerate(query_data):
@@ -288,12 +1213,25 @@ class Guide(kaa.Object):
         Get all channels
         """
         if sort:
-            channels = self._channels_by_name.values()[:]
-            channels.sort(lambda a, b: cmp(a.name, b.name))
-            channels.sort(lambda a, b: cmp_channel(a, b))
-            return channels
+            return self._channels_sorted[:]
         return self._channels_by_name.values()
 
+    def set_channel_sort_number(self, channel, sort_number):
+        """
+        Set the position of a channel in the sorted channel list.
+
+        :param channel: the channel to move
+        :type channel: :class:`~kaa.epg.Channel` object
+        :param sort_number: the new sort number or None to sort the channel
+                            by its tuner id again
+        """
+        self._db.update(('channel', channel.db_id), sort_number=sort_number)
+        metadata.write_snapshot(self._db)
+        self._db.commit()
+        channel = self._channels_by_db_id[channel.db_id]
+        channel.sort_number = sort_number
+        self._sort_channels()
+
 
     @kaa.coroutine()
     def update(self, backend = None, *args, **kwargs):
@@ -309,21 +1247,201 @@ class Guide(kaa.Object):
     def get_keywords(self, associated=None, prefix=None):
         """
         Retrieves a list of keywords in the database.
+
+        Keywords starting with a prefix are found in memory, the keywords
+        are kept until the next update.
         """
-        yield self._db.get_inverted_index_terms('keywords', associated, prefix)
+        measure = self._measure('get_keywords', kwargs=dict(associated=associated, prefix=prefix))
+        if prefix and not associated:
+            self._check_changed()
+            result = self._get_keywords().complete(prefix, None)
+        else:
+            result = self._db.get_inverted_index_terms('keywords', associated, prefix)
+        if measure is not None:
+            measure.done(len(result))
+        yield result
 
 
+    @kaa.coroutine()
+    def get_genre_counts(self, time=None, channel=None):
+        """
+        Return the number of programs per genre.
+
+        :param time: a point in time, a (start, stop) tuple or None for the
+                     whole guide
+        :param channel: channel or list of channels, None for all
+        :return: dict mapping the genre to the number of programs
+
+        Programs are counted by their start time in hourly buckets, so the
+        time window is extended to full hours.  The counts are precomputed
+        by the updater and no program rows are read.
+        """
+        channels = self._normalize_query(channel, None)[0]
+        yield facets.get_counts(self._db, channels, *self._genre_window(time))
+
+    def _genre_window(self, time):
+        """
+        Convert the time argument of get_genre_counts to (start, stop).
+        """
+        if time is None:
+            return None, None
+        if isinstance(time, (tuple, list)):
+            return int(to_timestamp(time[0])), int(to_timestamp(time[1]))
+        time = int(to_timestamp(time))
+        return time, time + 1
+
+    def _get_keywords(self):
+        """
+        Return the keywords as they are stored in the database, loading them
+        if needed.
+        """
+        if self._keywords is None:
+            self._keywords = TermIndex(self._db.get_inverted_index_terms('keywords'), normalize=False)
+        return self._keywords
+
+    def _get_terms(self):
+        """
+        Return the completion terms, building them if needed.
+        """
+        if self._terms is None:
+            t0 = time.time()
+            keywords = self._get_keywords().items()
+            titles = self._db._db_query('SELECT title, count(*) FROM objects_program GROUP BY title')
+            self._terms = TermIndex(keywords + titles)
+            log.debug('completion terms built in %0.3f secs', time.time() - t0)
+        return self._terms
+
+    @kaa.coroutine()
+    def complete(self, prefix, limit=10):
+        """
+        Complete a search term from the keywords and titles in the database.
+
+        :param prefix: the beginning of the term
+        :param limit: maximum number of results
+        :return: list of (term, count) tuples, the most frequent first
+
+        Terms and prefix are normalized (lowercase, no punctuation or
+        accents).  The terms are kept in memory until the next update, so
+        this does not query the database.
+        """
+        self._check_changed()
+        yield self._get_terms().complete(prefix, limit)
+
     @kaa.coroutine()
     def get_genres(self, associated=None, prefix=None):
         """
         Retrieves a list of genres in the database.
         """
-        yield self._db.get_inverted_index_terms('genres', associated, prefix)
+        measure = self._measure('get_genres', kwargs=dict(associated=associated, prefix=prefix))
+        result = self._db.get_inverted_index_terms('genres', associated, prefix)
+        if measure is not None:
+            measure.done(len(result))
+        yield result
+
+    @kaa.coroutine()
+    def get_stats(self, reset=False):
+        """
+        Return the query latency statistics.
+
+        :param reset: clear the statistics afterwards
+        :return: None if the statistics are disabled, otherwise a dict with
+                 the upper bounds of the latency histogram buckets in seconds
+                 as ``histogram`` and a dict mapping query shapes to their
+                 statistics as ``queries``.
+
+        A query shape is a string of the method name, the names of the
+        search kwargs and the size classes of the number of channels and the
+        time window, e.g. ``search keywords channels<=10 window<=1d``.  The
+        statistics of a shape are a dict with the number of queries
+        (``count``), the returned rows (``rows``), the time spent querying
+        the database (``query_time``) and creating result objects
+        (``build_time``), the slowest query (``max_time``) and the latency
+        histogram (``histogram``, the last bucket counts all queries slower
+        than the last bound).  RPC server handlers are recorded with the
+        prefix ``rpc.``.
+        """
+        if self._stats is None:
+            yield None
+        yield self._stats.get(reset)
+
+    def _measure(self, name, channels=None, start=None, stop=None, kwargs=None):
+        """
+        Start timing a query if statistics are enabled.
+
+        :return: :class:`~kaa.epg.stats.Measurement` object or None
+        """
+        if self._stats is None:
+            return None
+        return self._stats.measure(name, channels, start, stop, kwargs)
 
     @property
     def num_programs(self):
         return self._num_programs
 
+    @property
+    def cache(self):
+        """
+        The search result cache or None if caching is disabled.
+        """
+        return self._cache
+
+class ExtraInfos(object):
+    """
+    Sequence of extra_info dicts passed to programs-retrieved callbacks.
+    The dict for a row is created when a callback first accesses it, so
+    callbacks that only mark a few rows do not pay for all of them.
+    """
+    __slots__ = ('infos',)
+
+    def __init__(self, length):
+        self.infos = [ None ] * length
+
+    def __len__(self):
+        return len(self.infos)
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [ self[i] for i in range(*n.indices(len(self.infos))) ]
+        info = self.infos[n]
+        if info is None:
+            info = self.infos[n] = {}
+        return info
+
+    def __iter__(self):
+        for n in xrange(len(self.infos)):
+            yield self[n]
+
+
+class SearchCursor(object):
+    """
+    Cursor over the result of :meth:`~Guide.iter_search`.
+    """
+    def __init__(self, guide, ids, cls, chunk_size, attrs=None):
+        self._guide = guide
+        self._ids = ids
+        self._cls = cls
+        self._chunk_size = chunk_size
+        self._attrs = attrs
+        #: Number of programs already fetched
+        self.position = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    @kaa.coroutine()
+    def fetch(self):
+        """
+        Fetch the next chunk of programs.  An empty list is returned when
+        all programs have been fetched.
+        """
+        ids = self._ids[self.position:self.position+self._chunk_size]
+        self.position += len(ids)
+        if not ids:
+            yield []
+        programs = yield self._guide.get_programs(ids, self._cls, self._attrs)
+        yield programs
+
+
 def to_timestamp(dt):
     """
     Converts a time to a unix timestamp (seconds since epoch UTC)
@@ -0,0 +1,153 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# index.py - In-memory interval index over the program table
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+__all__ = [ 'IntervalIndex', 'GAP_START', 'GAP_STOP' ]
+
+# python imports
+from array import array
+from bisect import bisect_left
+
+#: Start of a gap before the first program of a channel
+GAP_START = 0
+#: Stop of a gap after the last program of a channel
+GAP_STOP = 2**31 - 1
+
+
+class IntervalIndex(object):
+    """
+    Per-channel interval index of (start, stop, id) for all programs.
+
+    Programs of one channel are kept sorted by start time together with a
+    running maximum of their stop times.  Since the running maximum is
+    monotonic, the first program that may still be airing at a given time
+    can be found with a binary search, and a time window lookup costs
+    O(log n + k) regardless of the longest program in the guide.  Programs
+    of a channel normally do not overlap (the updater removes conflicts),
+    but overlapping entries are still handled correctly.
+    """
+    def __init__(self, rows):
+        """
+        Build the index from (channel_db_id, start, stop, program_db_id)
+        rows sorted by channel db id and start time.
+        """
+        self._channels = {}
+        current = None
+        for channel_db_id, start, stop, program_db_id in rows:
+            if current != channel_db_id:
+                current = channel_db_id
+                starts, stops, maxstops, ids = array('l'), array('l'), array('l'), array('l')
+                self._channels[channel_db_id] = starts, stops, maxstops, ids
+                maxstop = stop
+            if stop > maxstop:
+                maxstop = stop
+            starts.append(start)
+            stops.append(stop)
+            maxstops.append(maxstop)
+            ids.append(program_db_id)
+
+    def __len__(self):
+        return sum(len(c[0]) for c in self._channels.values())
+
+    def channels(self):
+        """
+        Return the db ids of all channels that have programs.
+        """
+        return self._channels.keys()
+
+    def arrays(self, channel_db_id):
+        """
+        Return the (starts, stops, maxstops, ids) arrays of the given channel
+        or None if the channel has no programs.
+        """
+        return self._channels.get(channel_db_id)
+
+    def programs(self, channel_db_id, start, stop=None, limit=None, gaps=False):
+        """
+        Return (start, stop, program_db_id) tuples sorted by start for all
+        programs of the given channel intersecting with [start, stop].  A stop
+        of None means infinity.  If limit is given, at most limit programs
+        are returned.
+
+        If gaps is True, the times not covered by any program of the channel
+        are included as (start, stop, None) tuples.  A gap reaches from the
+        stop of the previous program to the start of the next one, or to
+        GAP_START and GAP_STOP if there is none.
+        """
+        if gaps:
+            return self._programs_and_gaps(channel_db_id, start, stop, limit)
+        if channel_db_id not in self._channels:
+            return []
+        starts, stops, maxstops, ids = self._channels[channel_db_id]
+        result = []
+        for pos in xrange(bisect_left(maxstops, start), len(starts)):
+            if stop is not None and starts[pos] > stop:
+                break
+            if stops[pos] >= start:
+                result.append((starts[pos], stops[pos], ids[pos]))
+                if len(result) == limit:
+                    break
+        return result
+
+    def _programs_and_gaps(self, channel_db_id, start, stop, limit):
+        """
+        Same as programs() with gaps, both are collected in one pass.
+        """
+        if channel_db_id not in self._channels:
+            return [ (GAP_START, GAP_STOP, None) ]
+        starts, stops, maxstops, ids = self._channels[channel_db_id]
+        result = []
+        pos = bisect_left(maxstops, start)
+        # All programs before pos end before start, so the time until the
+        # maximum stop of these programs is covered.
+        covered = maxstops[pos-1] if pos else GAP_START
+        while pos < len(starts) and (stop is None or starts[pos] <= stop):
+            if starts[pos] > covered and starts[pos] >= start:
+                result.append((covered, starts[pos], None))
+            if stops[pos] >= start:
+                result.append((starts[pos], stops[pos], ids[pos]))
+            if stops[pos] > covered:
+                covered = stops[pos]
+            pos += 1
+            if limit is not None and len(result) >= limit:
+                return result[:limit]
+        if stop is None or covered <= stop:
+            following = starts[pos] if pos < len(starts) else GAP_STOP
+            if following > covered:
+                result.append((covered, following, None))
+        return result
+
+    def find(self, channels, start, stop=None):
+        """
+        Return the db ids of all programs on the given channels (list of
+        channel db ids or None for all) intersecting with [start, stop].
+        """
+        if channels is None:
+            channels = self._channels.keys()
+        ids = []
+        for channel_db_id in channels:
+            ids.extend(p[2] for p in self.programs(channel_db_id, start, stop))
+        return ids
@@ -0,0 +1,130 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# metadata.py - Persisted snapshot of the channel map for fast startup
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+__all__ = [ 'create_triggers', 'write_snapshot', 'read_snapshot', 'clear_snapshot', 'get_generation' ]
+
+# python imports
+import json
+import logging
+
+# get logging object
+log = logging.getLogger('epg')
+
+#: Metadata key of the snapshot
+SNAPSHOT_KEY = 'kaa.epg::channel_snapshot'
+#: Format version of the snapshot, increase it if the format changes
+SNAPSHOT_VERSION = 2
+#: Metadata key of the counter bumped by every write to the channel table
+CHANNEL_VERSION_KEY = 'kaa.epg::channel_version'
+#: Metadata key of the counter bumped by every snapshot, i.e. after each
+#: complete update
+GENERATION_KEY = 'kaa.epg::generation'
+
+_CHANNEL_ATTRS = 'id', 'name', 'long_name', 'tuner_id', 'sort_number'
+
+
+def create_triggers(db):
+    """
+    Create the triggers bumping the channel version on every insert, update
+    or delete of a channel, including writes by other processes and older
+    versions of kaa.epg, if they are missing.  This is done by the updater,
+    as kaa.db drops the triggers if it recreates the table.
+    """
+    rows = db._db_query("SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE 'channel_version_%'")
+    if len(rows) == 3:
+        return
+    db._db_query('INSERT OR IGNORE INTO meta VALUES (?, 0)', (CHANNEL_VERSION_KEY,))
+    for event in 'INSERT', 'UPDATE', 'DELETE':
+        db._db_query("""CREATE TRIGGER IF NOT EXISTS channel_version_%s AFTER %s ON objects_channel
+                        BEGIN
+                            UPDATE meta SET value=value+1 WHERE attr='%s';
+                        END""" % (event.lower(), event, CHANNEL_VERSION_KEY))
+    db.commit()
+
+
+def _channel_stats(db):
+    """
+    Return the number of channels, the highest channel db id and the
+    channel version.
+    """
+    row = db._db_query_row('SELECT count(*), max(id) FROM objects_channel')
+    return tuple(row) + (int(db.get_metadata(CHANNEL_VERSION_KEY, 0)),)
+
+
+def write_snapshot(db):
+    """
+    Store all channels and the program statistics in the database metadata
+    and bump the generation, so other processes know the changes are
+    complete.  The caller has to commit the database.
+    """
+    channels = [ [ row.get(attr) for attr in _CHANNEL_ATTRS ] for row in db.query(type='channel') ]
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'stats': _channel_stats(db),
+        'num_programs': int(db.get_metadata('kaa.epg::num_programs', 0)),
+        'max_program_length': int(db.get_metadata('kaa.epg::max_program_length', 0)),
+        'channels': channels,
+    }
+    db.set_metadata(SNAPSHOT_KEY, json.dumps(snapshot, separators=(',', ':')))
+    db.set_metadata(GENERATION_KEY, str(get_generation(db) + 1))
+
+
+def read_snapshot(db):
+    """
+    Return the stored snapshot as a dict with the keys num_programs,
+    max_program_length and channels (a list of dicts usable as channel
+    dbdata), or None if there is no valid snapshot.
+    """
+    value = db.get_metadata(SNAPSHOT_KEY)
+    if not value:
+        return None
+    try:
+        snapshot = json.loads(value)
+    except ValueError:
+        log.warning('ignoring corrupt channel snapshot')
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    if tuple(snapshot['stats']) != _channel_stats(db):
+        log.info('channel snapshot is stale')
+        return None
+    snapshot['channels'] = [ dict(zip(_CHANNEL_ATTRS, c)) for c in snapshot['channels'] ]
+    return snapshot
+
+
+def get_generation(db):
+    """
+    Return the number of snapshots written so far.
+    """
+    return int(db.get_metadata(GENERATION_KEY, 0))
+
+
+def clear_snapshot(db):
+    """
+    Invalidate the snapshot, e.g. while the channels are modified.
+    """
+    db.set_metadata(SNAPSHOT_KEY, '')
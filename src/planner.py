@@ -0,0 +1,98 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# planner.py - Recording conflict resolution
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+__all__ = [ 'Recording', 'make_tuners', 'schedule' ]
+
+# python imports
+from bisect import bisect_right
+from collections import namedtuple
+
+#: A planned recording.  start and stop include the padding, tuner is None
+#: for programs that could not be scheduled.
+Recording = namedtuple('Recording', ('program', 'request', 'tuner', 'start', 'stop'))
+
+
+def make_tuners(tuners):
+    """
+    Convert the tuners argument of plan_recordings into a list of (name,
+    tuner ids) tuples.  tuners is either the number of identical tuners or a
+    dict mapping the tuner name to the list of tuner ids the tuner can
+    receive (None for all channels).
+    """
+    if isinstance(tuners, (int, long)):
+        return [ (n, None) for n in range(tuners) ]
+    return [ (name, set(ids) if ids is not None else None) for name, ids in sorted(tuners.items()) ]
+
+
+def schedule(candidates, tuners):
+    """
+    Assign candidate recordings to tuners.
+
+    :param candidates: list of (start, stop, priority, tuner_ids, data) tuples;
+                       tuner_ids are the tuner ids of the program's channel
+    :param tuners: list of (name, tuner ids) as returned by make_tuners
+    :return: (scheduled, conflicts) where scheduled is a list of (candidate,
+             tuner name) tuples and conflicts a list of candidates
+
+    Candidates are processed from the highest to the lowest priority.  Within
+    one priority the classic greedy interval scheduling is used: candidates
+    are sorted by stop time and each is put on the eligible free tuner that
+    became free last before the candidate starts.  For identical tuners this
+    schedules the maximum possible number of recordings.
+    """
+    # Booked intervals of each tuner, sorted and non-overlapping.
+    booked = [ ([], []) for t in tuners ]
+    # Tuners that can receive a channel, keyed by its tuner ids.
+    eligible = {}
+    scheduled = []
+    conflicts = []
+    for candidate in sorted(candidates, key=lambda c: (-c[2], c[1], c[0])):
+        start, stop, priority, tuner_ids, data = candidate
+        key = tuple(tuner_ids)
+        if key not in eligible:
+            eligible[key] = [ n for n, (name, ids) in enumerate(tuners) if ids is None or ids.intersection(key) ]
+        best = None
+        for n in eligible[key]:
+            starts, stops = booked[n]
+            pos = bisect_right(starts, start)
+            if pos < len(starts) and starts[pos] < stop:
+                # The next booking starts before this one ends.
+                continue
+            if pos > 0 and stops[pos-1] > start:
+                # The previous booking is still running.
+                continue
+            free = stops[pos-1] if pos > 0 else None
+            if best is None or free > best[1]:
+                best = n, free, pos
+        if best is None:
+            conflicts.append(candidate)
+            continue
+        n, free, pos = best
+        booked[n][0].insert(pos, start)
+        booked[n][1].insert(pos, stop)
+        scheduled.append((candidate, tuners[n][0]))
+    return scheduled, conflicts
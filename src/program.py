@@ -30,11 +30,59 @@
 __all__ = [ 'Program' ]
 
 from datetime import datetime
+from collections import namedtuple
 
 from kaa import unicode_to_str
 import kaa.dateutils
 
 
+class _Field(object):
+    """
+    Program attribute read from the database row when referenced.  A value
+    of the same name in the extra info of the program, added by a
+    program-retrieved callback or by assigning the attribute, takes
+    precedence.
+    """
+    __slots__ = ('name', 'key', 'default')
+
+    def __init__(self, name, key=None, default=None):
+        self.name = name
+        self.key = key or name
+        self.default = default
+
+    def __get__(self, program, cls):
+        if program is None:
+            return self
+        extra = program._extra
+        if extra and self.name in extra:
+            return extra[self.name]
+        return self.value(program)
+
+    def __set__(self, program, value):
+        # Copy the extra info, it may be shared with other programs of the
+        # same row, e.g. in the now/next table.
+        extra = dict(program._extra) if program._extra else {}
+        extra[self.name] = value
+        program._extra = extra
+
+    def value(self, program):
+        return program._dbdata.get(self.key, self.default)
+
+
+class _Computed(_Field):
+    """
+    Program attribute computed by the decorated function.
+    """
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        super(_Computed, self).__init__(func.__name__)
+        self.func = func
+
+    def value(self, program):
+        return self.func(program)
+
+
 class Program(object):
     """
     kaa.epg.Program class.
@@ -53,40 +101,108 @@ class Program(object):
     # If this program has been previously shown
     FLAG_PREVIOUSLY_SHOWN = 32
 
+    # __dict__ is only created if an application sets its own attributes.
+    __slots__ = ('_channel', '_dbdata', '_extra', '_start', '_stop', '__dict__', '__weakref__')
+
     def __init__(self, channel, dbdata, extrainfo):
-        self.channel = channel
+        self._channel = channel
         self._dbdata = dbdata
-        if extrainfo:
-            self.__dict__.update(extrainfo)
+        self._extra = extrainfo or None
+        self._start = self._stop = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update(_channel=self._channel, _dbdata=self._dbdata, _extra=self._extra)
+        return state
+
+    def __setstate__(self, state):
+        self._start = self._stop = None
+        for attr, value in state.items():
+            setattr(self, attr, value)
 
     def __getattr__(self, attr):
         """
-        Defer accessing the ObjectRow (dbdata) until referenced, as this will
-        defer any ObjectRow unpickling.
+        Return additional info added by program-retrieved callbacks.
         """
-        if hasattr(self, '_dbdata') and attr != '_dbdata':
-            self.db_id = self._dbdata.get('type'), self._dbdata.get('id')
-            # Unix timestamps are always seconds since epoch UTC.
-            self.start_timestamp = self._dbdata.get('start', 0)
-            self.stop_timestamp = self._dbdata.get('stop', 0)
-            # Timezone-aware datetime objects in the local timezone.
-            self.start = datetime.fromtimestamp(self.start_timestamp, kaa.dateutils.local)
-            self.stop = datetime.fromtimestamp(self.stop_timestamp, kaa.dateutils.local)
-
-            self.title = self._dbdata.get('title', u'')
-            self.description = self._dbdata.get('desc', u'')
-            self.subtitle = self._dbdata.get('subtitle',  u'')
-            self.episode = self._dbdata.get('episode')
-            self.genres = self._dbdata.get('genres', [])
-            self.advisories = self._dbdata.get('advisories', [])
-            self.rating = self._dbdata.get('rating')
-            self.score = self._dbdata.get('score')
-            self.flags = self._dbdata.get('flags')
-            self.credits = self._dbdata.get('credits')
-            self.date = self._dbdata.get('date')
-            self.year = self._dbdata.get('year')
-            del self._dbdata
-        return self.__getattribute__(attr)
+        if attr[0] != '_' and self._extra and attr in self._extra:
+            return self._extra[attr]
+        raise AttributeError(attr)
+
+    # All attributes are read from the ObjectRow (dbdata) when referenced,
+    # as this will defer any ObjectRow unpickling until a non-indexed
+    # attribute is needed.  They can be overridden by extra info or by
+    # assigning them.
+
+    @_Computed
+    def channel(self):
+        return self._channel
+
+    @_Computed
+    def db_id(self):
+        return self._dbdata.get('type'), self._dbdata.get('id')
+
+    @_Computed
+    def start_timestamp(self):
+        # Unix timestamps are always seconds since epoch UTC.
+        return self._dbdata.get('start', 0)
+
+    @_Computed
+    def stop_timestamp(self):
+        return self._dbdata.get('stop', 0)
+
+    @_Computed
+    def start(self):
+        # Timezone-aware datetime object in the local timezone.
+        if self._start is None:
+            self._start = datetime.fromtimestamp(self.start_timestamp, kaa.dateutils.local)
+        return self._start
+
+    @_Computed
+    def stop(self):
+        if self._stop is None:
+            self._stop = datetime.fromtimestamp(self.stop_timestamp, kaa.dateutils.local)
+        return self._stop
+
+    @_Computed
+    def genres(self):
+        return self._dbdata.get('genres', [])
+
+    @_Computed
+    def advisories(self):
+        return self._dbdata.get('advisories', [])
+
+    # False for placeholders of times without programs (fill_gaps searches)
+    @_Computed
+    def valid(self):
+        return self._dbdata.get('id') is not None
+
+    title = _Field('title', default=u'')
+    description = _Field('description', 'desc', u'')
+    subtitle = _Field('subtitle', default=u'')
+    episode = _Field('episode')
+    rating = _Field('rating')
+    score = _Field('score')
+    flags = _Field('flags')
+    credits = _Field('credits')
+    date = _Field('date')
+    year = _Field('year')
+    series_id = _Field('series_id')
+    program_id = _Field('program_id')
 
     def __repr__(self):
         return '<kaa.epg.Program %s>' % unicode_to_str(self.title)
+
+
+# namedtuple classes for projection queries, keyed on the attribute names
+_tuple_classes = {}
+
+def program_tuple(attrs):
+    """
+    Return a namedtuple class with the fields channel and attrs, used as a
+    lightweight program representation when only some attributes are
+    requested in a search.
+    """
+    attrs = tuple(attrs)
+    if attrs not in _tuple_classes:
+        _tuple_classes[attrs] = namedtuple('ProgramTuple', ('channel',) + attrs)
+    return _tuple_classes[attrs]
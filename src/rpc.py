@@ -31,6 +31,7 @@ __all__ = [ 'Client', 'Server' ]
 
 # python imports
 import logging
+import functools
 from datetime import datetime
 
 # kaa imports
@@ -42,11 +43,40 @@ import kaa.dateutils
 from channel import Channel
 from program import Program
 from guide import Guide, to_timestamp
-from util import EPGError, cmp_channel
+from terms import TermIndex
+from util import EPGError
 
 # get logging object
 log = logging.getLogger('epg')
 
+def utc_time(time):
+    """
+    Convert the time argument of a search to UTC timestamps because the
+    server may have a different local timezone set.
+    """
+    if isinstance(time, (tuple, list)):
+        return to_timestamp(time[0]), to_timestamp(time[1])
+    if time is not None:
+        return to_timestamp(time)
+    return None
+
+def timed(func):
+    """
+    Decorator recording the time of a :class:`Server` handler in the
+    statistics of the guide.
+    """
+    @functools.wraps(func)
+    def handler(self, *args, **kwargs):
+        measure = self.guide._measure('rpc.' + func.func_name, kwargs=kwargs)
+        result = func(self, *args, **kwargs)
+        if measure is not None:
+            if isinstance(result, kaa.InProgress) and not result.finished:
+                result.connect_both(lambda *args: measure.done())
+            else:
+                measure.done()
+        return result
+    return handler
+
 class Client(Guide):
     """
     EPG client class to access the epg on server side.
@@ -55,9 +85,15 @@ class Client(Guide):
     def __init__(self, address, secret):
         self.connected = False
         self._num_programs = 0
+        self._cache = None
         self._channels_by_name = {}
         self._channels_by_db_id = {}
         self._channels_by_tuner_id = {}
+        self._channels_sorted = []
+        self._terms = None
+        # Running fetch of the completion terms and its request number
+        self._terms_fetch = None
+        self._terms_request = 0
         self.rpc = None
         self.signals = kaa.Signals('connected', 'disconnected')
         self._server_address = address
@@ -88,11 +124,52 @@ class Client(Guide):
             self._channels_by_db_id[chan.db_id] = chan
             for t in chan.tuner_id:
                 self._channels_by_tuner_id[t] = chan
+        self._sort_channels()
+        # Fetch the completion terms in the background
+        self._terms = None
+        self._terms_fetch = self._fetch_terms()
         if not self.connected:
             log.info('kaa.epg client connected')
             self.connected = True
             self.signals["connected"].emit()
 
+    @kaa.coroutine()
+    def _fetch_terms(self):
+        """
+        Mirror the completion terms of the server.  The terms of an older
+        request, e.g. from before the last sync, are dropped.
+        """
+        self._terms_request += 1
+        request = self._terms_request
+        try:
+            terms = yield self.channel.rpc('get_terms')
+        except Exception, e:
+            # complete() tries again
+            log.warning('Fetching the completion terms failed: %s', e)
+            return
+        if request == self._terms_request:
+            self._terms = TermIndex(terms)
+
+    def _get_terms(self):
+        """
+        Return the mirrored completion terms.  Until they are received from
+        the server, no terms are known.
+        """
+        return self._terms or TermIndex([])
+
+    @kaa.coroutine()
+    def complete(self, prefix, limit=10):
+        """
+        Complete a search term from the mirrored terms of the server.
+        See :meth:`Guide.complete` for details.
+        """
+        if self._terms is None:
+            # Wait for the terms, fetch them again if the last fetch failed.
+            if self._terms_fetch is None or self._terms_fetch.finished:
+                self._terms_fetch = self._fetch_terms()
+            yield self._terms_fetch
+        yield self._get_terms().complete(prefix, limit)
+
     @kaa.coroutine()
     def search(self, channel=None, time=None, cls=Program, **kwargs):
         """
@@ -141,22 +218,155 @@ class Client(Guide):
 
         With the exception of ``keywords`` and ``genres``, a :class:`~kaa.db.QExpr`
         object can be used with any of the above kwargs.
+
+        The result can be paged with ``limit`` and ``offset``.  ``order_by``
+        sorts the result by ``start``, ``title`` or ``channel``; it defaults to
+        ``start`` if an offset is given.  For large results see
+        :meth:`~Guide.iter_search`.
+
+        If ``attrs`` is given as a list of attribute names, only these columns
+        are fetched from the database and the result is a list of named
+        tuples with the fields ``channel`` followed by the requested
+        attributes.  Simple attributes such as ``credits`` or ``genres`` are
+        only unpickled if requested.  The program-retrieved signal is not
+        emitted for such queries.
+
+        If ``fill_gaps`` is True, the times within the searched time range
+        where a channel has no program at all (e.g. a channel off air at
+        night or a guide ending early) are included as placeholder programs
+        with ``valid`` set to False.  A placeholder reaches from the end of
+        the previous program to the start of the next one.  This requires a
+        time and ``order_by`` ``start`` (the default) or ``channel``.
         """
         if self.channel.status == kaa.rpc.DISCONNECTED:
             raise EPGError('Client is not connected')
-        # convert to UTC because the server may have a different
-        # local timezone set.
-        if time is not None:
-            if isinstance(time, (tuple, list)):
-                time = to_timestamp(time[0]), to_timestamp(time[1])
-            else:
-                time = to_timestamp(time)
-        query_data, extra_data = yield self.channel.rpc('search', channel, time, None, **kwargs)
+        query_data, extra_data = yield self.channel.rpc('search', channel, utc_time(time), None, **kwargs)
         if cls is None:
             yield  query_data, extra_data
+        if kwargs.get('attrs'):
+            yield self._rows_to_tuples(kwargs.get('attrs'), query_data)
         # Convert raw search result data from the server into python objects.
         yield self._rows_to_programs(cls, query_data, extra_data)
 
+    @kaa.coroutine()
+    def search_ids(self, channel=None, time=None, order_by='start', **kwargs):
+        """
+        Search the EPG and return the db ids of the matching programs.
+        See :meth:`Guide.search_ids` for details.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        ids = yield self.channel.rpc('search_ids', channel, utc_time(time), order_by, **kwargs)
+        yield ids
+
+    @kaa.coroutine()
+    def count(self, channel=None, time=None, count_by=None, **kwargs):
+        """
+        Count the programs matching a search.
+        See :meth:`Guide.count` for details.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        result = yield self.channel.rpc('count', channel, utc_time(time), count_by, **kwargs)
+        yield self._count_result(count_by, result)
+
+    @kaa.coroutine()
+    def get_programs(self, ids, cls=Program, attrs=None):
+        """
+        Get programs by their db ids.
+        See :meth:`Guide.get_programs` for details.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        query_data, extra_data = yield self.channel.rpc('get_programs', ids, attrs)
+        if cls is None:
+            yield query_data, extra_data
+        if attrs:
+            yield self._rows_to_tuples(attrs, query_data)
+        yield self._rows_to_programs(cls, query_data, extra_data)
+
+    @kaa.coroutine()
+    def get_grid(self, channels, start, stop, cls=Program, fill_gaps=False):
+        """
+        Get the programs of several channels within a time window.
+        See :meth:`Guide.get_grid` for details.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        # convert to UTC because the server may have a different
+        # local timezone set.
+        grid = yield self.channel.rpc('get_grid', channels, to_timestamp(start), to_timestamp(stop), fill_gaps)
+        if cls is None:
+            yield grid
+        yield self._rows_to_grid(cls, grid)
+
+    @kaa.coroutine()
+    def _series_rows(self, query):
+        """
+        Query the programs of a series on the server, see
+        :meth:`Guide.get_series`.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        result = yield self.channel.rpc('get_series', query)
+        yield result
+
+    @kaa.coroutine()
+    def get_now_next(self, channels=None, cls=Program):
+        """
+        Get the currently running and the next program of channels.
+        See :meth:`Guide.get_now_next` for details.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        now_next = yield self.channel.rpc('get_now_next', channels)
+        if cls is None:
+            yield now_next
+        yield self._rows_to_now_next(cls, now_next)
+
+
+    @kaa.coroutine()
+    def snapshot_arrays(self, start=None, stop=None):
+        """
+        Export all programs of a time window as parallel numpy arrays.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        try:
+            from snapshot import Snapshot
+        except ImportError:
+            raise EPGError('numpy is required for snapshot_arrays')
+        channels, columns = yield self.channel.rpc('snapshot_arrays', utc_time(start), utc_time(stop))
+        channels = [ self._channels_by_db_id[db_id] for db_id in channels ]
+        yield Snapshot(channels, *columns)
+
+    @kaa.coroutine()
+    def plan_recordings(self, requests, tuners=1, padding=0, cls=Program):
+        """
+        Plan recordings and resolve conflicts.
+        See :meth:`Guide.plan_recordings` for details.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        # The results refer to the caller's requests, not the UTC copies.
+        remote = [ dict(r, time=utc_time(r['time'])) if 'time' in r else r for r in requests ]
+        scheduled, conflicts, extra_data = \
+            yield self.channel.rpc('plan_recordings', remote, tuners, padding)
+        if cls is None:
+            yield scheduled, conflicts, extra_data
+        yield self._recordings_to_programs(cls, requests, scheduled, conflicts, extra_data)
+
+    @kaa.coroutine()
+    def set_channel_sort_number(self, channel, sort_number):
+        """
+        Set the position of a channel in the sorted channel list.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        yield self.channel.rpc('set_channel_sort_number', channel.db_id, sort_number)
+        channel = self._channels_by_db_id[channel.db_id]
+        channel.sort_number = sort_number
+        self._sort_channels()
 
     def update(self):
         """
@@ -173,6 +383,17 @@ class Client(Guide):
         result = yield self.channel.rpc('get_keywords', associated, prefix)
         yield result
 
+    @kaa.coroutine()
+    def get_genre_counts(self, time=None, channel=None):
+        """
+        Return the number of programs per genre.
+        See :meth:`Guide.get_genre_counts` for details.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        result = yield self.channel.rpc('get_genre_counts', utc_time(time), channel)
+        yield result
+
     @kaa.coroutine()
     def get_genres(self, associated=None, prefix=None):
         if self.channel.status == kaa.rpc.DISCONNECTED:
@@ -180,6 +401,17 @@ class Client(Guide):
         result = yield self.channel.rpc('get_genres', associated, prefix)
         yield result
 
+    @kaa.coroutine()
+    def get_stats(self, reset=False):
+        """
+        Return the query latency statistics of the server.
+        See :meth:`Guide.get_stats` for details.
+        """
+        if self.channel.status == kaa.rpc.DISCONNECTED:
+            raise EPGError('Client is not connected')
+        stats = yield self.channel.rpc('get_stats', reset)
+        yield stats
+
 
 
 
@@ -196,6 +428,7 @@ class Server(object):
         self._rpc.register(self)
 
     @kaa.rpc.expose()
+    @timed
     def search(self, channel, time, cls, **kwargs):
         """
         Remote search
@@ -203,26 +436,135 @@ class Server(object):
         return self.guide.search(channel, time, cls, **kwargs)
 
     @kaa.rpc.expose()
+    @timed
+    def search_ids(self, channel, time, order_by, **kwargs):
+        """
+        Remote search returning program db ids
+        """
+        return self.guide.search_ids(channel, time, order_by, **kwargs)
+
+    @kaa.rpc.expose()
+    @timed
+    def count(self, channel, time, count_by, **kwargs):
+        """
+        Remote count, channels are returned as db ids and days as time slots
+        """
+        channels, start, stop = self.guide._normalize_query(channel, time)
+        return self.guide._execute(self.guide._count, channels, start, stop, count_by, **kwargs)
+
+    @kaa.rpc.expose()
+    @timed
+    def get_programs(self, ids, attrs=None):
+        """
+        Remote query of programs by db id
+        """
+        return self.guide.get_programs(ids, None, attrs)
+
+    @kaa.rpc.expose()
+    @timed
+    def get_grid(self, channels, start, stop, fill_gaps):
+        """
+        Remote grid query
+        """
+        return self.guide.get_grid(channels, start, stop, None, fill_gaps)
+
+    @kaa.rpc.expose()
+    @timed
+    def get_series(self, query):
+        """
+        Remote query of the programs of a series
+        """
+        return self.guide._series_rows(query)
+
+    @kaa.rpc.expose()
+    @timed
+    def get_now_next(self, channels):
+        """
+        Remote now/next query
+        """
+        return self.guide.get_now_next(channels, None)
+
+    @kaa.rpc.expose()
+    def snapshot_arrays(self, start, stop):
+        """
+        Remote snapshot, channels are returned as db ids
+        """
+        self.guide._check_changed()
+        snapshot = self.guide._get_snapshot(start, stop)
+        channels = [ c.db_id for c in snapshot.channels ]
+        return channels, (snapshot.channel, snapshot.start, snapshot.stop, snapshot.id)
+
+    @kaa.rpc.expose()
+    @timed
+    def plan_recordings(self, requests, tuners, padding):
+        """
+        Remote recording planner
+        """
+        return self.guide.plan_recordings(requests, tuners, padding, None)
+
+    @kaa.rpc.expose()
+    def set_channel_sort_number(self, channel_db_id, sort_number):
+        """
+        Remote change of a channel sort number
+        """
+        channel = self.guide._channels_by_db_id[channel_db_id]
+        self.guide.set_channel_sort_number(channel, sort_number)
+        # Let all clients resort their channel list, same as after update.
+        for client in self._clients:
+            self._sync_client(client)
+
+    @kaa.rpc.expose()
+    def get_terms(self):
+        """
+        Remote access to the completion terms
+        """
+        return self.guide._get_terms().items()
+
+    @kaa.rpc.expose()
+    @timed
     def get_keywords(self, associated=None, prefix=None):
         return self.guide.get_keywords(associated, prefix)
 
     @kaa.rpc.expose()
+    @timed
+    def get_genre_counts(self, time, channel):
+        return self.guide.get_genre_counts(time, channel)
+
+    @kaa.rpc.expose()
+    @timed
     def get_genres(self, associated=None, prefix=None):
         return self.guide.get_genres(associated, prefix)
 
     @kaa.rpc.expose()
+    def get_stats(self, reset):
+        """
+        Remote query latency statistics
+        """
+        return self.guide.get_stats(reset)
+
+    @kaa.rpc.expose()
+    @kaa.coroutine()
     def update(self):
         """
         Remote update
         """
-        return self.guide.update()
+        yield self.guide.update()
+        # Send the new channel list and let the clients drop cached data.
+        for client in self._clients:
+            self._sync_client(client)
+
+    def _sync_client(self, client):
+        """
+        Send the channel list and the number of programs to a client.
+        """
+        client.rpc('_sync', self.guide._channels_by_name.values(), self.guide._num_programs)
 
     def client_connected(self, client):
         """
         Connect a new client to the server.
         """
         log.info('Client connected: %s', client)
-        client.rpc('_sync', self.guide._channels_by_name.values(), self.guide._num_programs)
+        self._sync_client(client)
         client.signals['closed'].connect(self.client_closed, client)
         self._clients.append(client)
 
@@ -0,0 +1,145 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# snapshot.py - Columnar numpy snapshot of the program table
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+__all__ = [ 'Snapshot' ]
+
+# python imports
+import numpy
+
+
+class Snapshot(object):
+    """
+    Parallel numpy arrays describing all programs of a time window.
+
+    Row i of the snapshot is the program with the db id ``id[i]`` on the
+    channel ``channels[channel[i]]``, airing from ``start[i]`` to
+    ``stop[i]`` (unix timestamps).  Rows are sorted by channel and start
+    time.  Programs are treated as half-open intervals [start, stop), so a
+    program is not airing anymore at its stop time.
+
+    The lookups assume that programs of one channel do not overlap, which
+    the updater guarantees for the database.
+    """
+    def __init__(self, channels, channel, start, stop, id):
+        """
+        :param channels: list of channels, ``channel`` holds indexes into it
+        :param channel: array of channel indexes
+        :param start: array of program start times
+        :param stop: array of program stop times
+        :param id: array of program db ids
+
+        The arrays must be sorted by channel index and start time.
+        """
+        self.channels = channels
+        self.channel = numpy.asarray(channel, dtype=numpy.int32)
+        self.start = numpy.asarray(start, dtype=numpy.int64)
+        self.stop = numpy.asarray(stop, dtype=numpy.int64)
+        self.id = numpy.asarray(id, dtype=numpy.int64)
+        # Row offsets of each channel: rows of channel c are
+        # _offsets[c]:_offsets[c+1]
+        self._offsets = numpy.searchsorted(self.channel, numpy.arange(len(channels) + 1))
+        # Running maximum of the stop times per channel, needed to find the
+        # first program that may intersect with a time.
+        self._maxstop = self.stop.copy()
+        for c in range(len(channels)):
+            first, last = self._offsets[c], self._offsets[c+1]
+            if last > first:
+                numpy.maximum.accumulate(self.stop[first:last], out=self._maxstop[first:last])
+
+    @classmethod
+    def from_index(cls, index, channels, start=None, stop=None):
+        """
+        Build a snapshot of all programs on the given channels intersecting
+        with [start, stop) from an :class:`~kaa.epg.index.IntervalIndex`.
+        None for start or stop means an open window.
+        """
+        columns = [], [], [], []
+        for c, channel in enumerate(channels):
+            arrays = index.arrays(channel.db_id)
+            if arrays is None:
+                continue
+            starts, stops, maxstops, ids = [ numpy.frombuffer(a, dtype=a.typecode) for a in arrays ]
+            lo, hi = 0, len(starts)
+            if start is not None:
+                lo = numpy.searchsorted(maxstops, start, 'right')
+            if stop is not None:
+                hi = numpy.searchsorted(starts, stop, 'left')
+            rows = numpy.arange(lo, max(lo, hi))
+            if start is not None:
+                rows = rows[stops[rows] > start]
+            columns[0].append(numpy.repeat(c, len(rows)))
+            for column, values in zip(columns[1:], (starts, stops, ids)):
+                column.append(values[rows])
+        columns = [ numpy.concatenate(c) if c else [] for c in columns ]
+        return cls(channels, *columns)
+
+    def __len__(self):
+        return len(self.id)
+
+    def programs_at(self, times):
+        """
+        Return the programs airing on every channel at the given times.
+
+        :param times: sequence of unix timestamps
+        :return: array of shape (len(times), len(channels)) with row indexes
+                 into the snapshot arrays, or -1 if nothing is airing.  Use
+                 ``snapshot.id[rows[rows >= 0]]`` to get the program db ids.
+        """
+        times = numpy.asarray(times, dtype=numpy.int64)
+        result = numpy.empty((len(times), len(self.channels)), dtype=numpy.int64)
+        result.fill(-1)
+        for c in range(len(self.channels)):
+            first, last = self._offsets[c], self._offsets[c+1]
+            if last == first:
+                continue
+            # Last program starting at or before the time.
+            rows = first + numpy.searchsorted(self.start[first:last], times, 'right') - 1
+            valid = rows >= first
+            valid[valid] = self.stop[rows[valid]] > times[valid]
+            result[valid, c] = rows[valid]
+        return result
+
+    def overlaps(self, intervals):
+        """
+        Return the programs on every channel intersecting with the given
+        time intervals.
+
+        :param intervals: sequence of (start, stop) unix timestamp pairs
+        :return: tuple of two arrays (first, last) of shape (len(intervals),
+                 len(channels)).  The programs of channel c intersecting with
+                 interval i are the rows first[i, c]:last[i, c] of the
+                 snapshot arrays; ``last - first`` is the number of programs.
+        """
+        intervals = numpy.asarray(intervals, dtype=numpy.int64).reshape(-1, 2)
+        first = numpy.empty((len(intervals), len(self.channels)), dtype=numpy.int64)
+        last = numpy.empty_like(first)
+        for c in range(len(self.channels)):
+            lo, hi = self._offsets[c], self._offsets[c+1]
+            first[:, c] = lo + numpy.searchsorted(self._maxstop[lo:hi], intervals[:, 0], 'right')
+            last[:, c] = lo + numpy.searchsorted(self.start[lo:hi], intervals[:, 1], 'left')
+        numpy.maximum(last, first, out=last)
+        return first, last
@@ -322,7 +322,8 @@ class Handler(xml.sax.handler.ContentHandler):
                                       date = program.get('date'), episode = program.get('episode'),
                                       genres = program.get('genres'), score = program.get('score'),
                                       subtitle = program.get('subtitle'), year = program.get('year'),
-                                      rating = rating, flags = schedule['flags'])
+                                      rating = rating, flags = schedule['flags'],
+                                      program_id = program['id'])
 
         elif name == 'genre':
             self._obj['genres'][self._obj['_class']] = self._obj['_relevance']
@@ -32,7 +32,9 @@ __all__ = [ 'update', 'sources' ]
 # python imports
 import logging
 import time
+import Queue
 from types import ListType
+from bisect import bisect_left, insort
 import os
 import kaa.utils
 
@@ -42,14 +44,23 @@ from kaa.db import *
 
 # kaa.epg imports
 from config import config
+from kaa.epg.util import series_id, program_id, fingerprint
+from kaa.epg import facets, metadata
+from kaa.epg.bulk import BulkWriter
 
 # get logging object
 log = logging.getLogger('epg.update')
 
 sources = {}
 
-# Register thread pool for backends.
+# Register thread pools for backends and for writing their programs.
 kaa.register_thread_pool('kaa.epg::update', kaa.ThreadPool())
+kaa.register_thread_pool('kaa.epg::sync', kaa.ThreadPool())
+
+#: Maximum number of queued programs, add_program() blocks if the queue is full
+QUEUE_SIZE = 20000
+#: Number of programs merged into the db in one batch
+BATCH_SIZE = 5000
 
 # Plugins are modules that define:
 #    1. a config Group object called 'sourcecfg' (optional)
@@ -70,8 +81,18 @@ class Updater(object):
     """
     def __init__(self, db):
         self._db = db
-        # Members for job queue.
+        # Tables and triggers missing in databases of older versions
+        facets.create_table(self._db)
+        metadata.create_triggers(self._db)
+        # Programs queued by the backend and the batch merged by sync()
+        self._queue = Queue.Queue(QUEUE_SIZE)
         self._jobs = []
+        # Pipeline statistics of each backend update
+        self.stats = {}
+        # Number of skipped, updated, inserted and deleted programs
+        self._counts = dict(skipped=0, updated=0, inserted=0, deleted=0)
+        # Genre count buckets changed since the last recount
+        self._buckets = set()
         # Tuner ids: id -> name
         self._tuner_ids = {}
         for c in self._db.query(type = "channel"):
@@ -89,14 +110,17 @@ class Updater(object):
         only call update() from that specific backend.  Otherwise call update
         on all enabled backends in the 'sources' config value.
         """
+        # Channels may change, don't restore them from the snapshot until
+        # the update is complete.
+        metadata.clear_snapshot(self._db)
         # Prune obsolete programs from database.
-        expired_time = time.time() - config.expired_days * 60 * 60 * 24
-        count = self._db.delete_by_query(type = "program", stop = QExpr('<', expired_time))
+        expired_time = int(time.time() - config.expired_days * 60 * 60 * 24)
+        count = self._expire(expired_time)
         if count:
             log.info('Deleted %d expired programs from database' % count)
-        # Vacuum database, which removes keywords with count=0
-        log.info('Vacuuming database')
-        self._db.vacuum()
+            facets.update_counts(self._db, None, expired_time)
+            self._db.commit()
+        self._vacuum()
 
         if backend:
             backends = [backend]
@@ -111,12 +135,16 @@ class Updater(object):
                 backends.remove(backend)
                 continue
             log.info('Updating backend %s', backend)
+            # The programs added by the backend are written in a separate
+            # thread while the backend is still parsing.
+            writer = self._write()
             # Backend's update() MUST return an InProgress object
             try:
                 yield sources[backend].update(self, *args, **kwargs)
             except Exception, e:
                 log.exception('Backend %s failed' % backend)
-            self.sync()
+            self._queue.put(None)
+            self.stats[backend] = yield writer
 
         if not backends:
             log.warning('No valid backends specified for update.')
@@ -133,10 +161,56 @@ class Updater(object):
                                       ORDER BY length 
                                           DESC LIMIT 1''')
         self._db.set_metadata('kaa.epg::max_program_length', row[0] if row else 0)
+        metadata.write_snapshot(self._db)
         self._db.commit()
         log.info('Database committed with %d programs.', num_programs)
 
 
+    def _expire(self, expired_time):
+        """
+        Delete all programs that ended before expired_time in batches of
+        config.expire_batch programs.  Each batch is committed, so readers
+        are never blocked for long.  Return the number of deleted programs.
+        """
+        count = 0
+        while True:
+            # stop < expired_time implies start < expired_time, which can
+            # use the (start, stop) index.
+            ids = self._db._db_query('SELECT id FROM objects_program WHERE start < ? AND stop < ? LIMIT ?',
+                                     (expired_time, expired_time, config.expire_batch))
+            if not ids:
+                return count
+            writer = BulkWriter(self._db, 'program')
+            for row in ids:
+                writer.delete(row[0])
+            count += writer.flush()[0]
+            self._db.commit()
+
+
+    def _vacuum(self):
+        """
+        Return at most config.vacuum_pages free pages to the file system using
+        the incremental auto vacuum of sqlite.  A full VACUUM, which rewrites
+        the whole file, is only done if more than config.vacuum_threshold
+        percent of the pages are free, or once to enable incremental auto
+        vacuum for an existing database.
+        """
+        pages = self._db._db_query_row('PRAGMA page_count')[0]
+        free = self._db._db_query_row('PRAGMA freelist_count')[0]
+        # auto_vacuum 2 is INCREMENTAL
+        incremental = self._db._db_query_row('PRAGMA auto_vacuum')[0] == 2
+        if not incremental or free * 100 > pages * config.vacuum_threshold:
+            log.info('Vacuuming database, %d of %d pages free', free, pages)
+            if not incremental:
+                # Only takes effect with the next VACUUM
+                self._db._db_query('PRAGMA auto_vacuum=INCREMENTAL')
+            # This also removes all keywords with count=0
+            self._db.vacuum()
+        elif free:
+            log.info('Incremental vacuum, %d of %d pages free', free, pages)
+            self._db._db_query('PRAGMA incremental_vacuum(%d)' % config.vacuum_pages)
+
+
     # -------------------------------------------------------------------------
     # functions called by source_* modules
     # -------------------------------------------------------------------------
@@ -203,33 +277,157 @@ class Updater(object):
 
         # New channel not in db, so add new object.
         log.debug('Adding channel %s %s (%s)', tuner_id, name, long_name)
-        return self._db.add('channel', tuner_id=tuner_id, name=name, long_name=long_name)['id']
+        # The writer thread must not run a query before the id is read.
+        self._db._lock.acquire()
+        try:
+            return self._db.add('channel', tuner_id=tuner_id, name=name, long_name=long_name)['id']
+        finally:
+            self._db._lock.release()
+
+
+    @kaa.threaded('kaa.epg::sync')
+    def _write(self):
+        """
+        Writer stage of a backend update: take the programs from the queue
+        and merge them into the db in batches of BATCH_SIZE until None is
+        queued.  Return a dict with throughput, queue depth and the time
+        spent waiting for the backend.
+        """
+        t0 = time.time()
+        programs = batches = 0
+        idle = 0.0
+        # Queue depth at the start of each batch
+        depth = []
+        self._counts = dict(skipped=0, updated=0, inserted=0, deleted=0)
+        done = False
+        while not done:
+            depth.append(self._queue.qsize())
+            while len(self._jobs) < BATCH_SIZE:
+                t1 = time.time()
+                job = self._queue.get()
+                idle += time.time() - t1
+                if job is None:
+                    done = True
+                    break
+                self._jobs.append(job)
+            if not self._jobs:
+                continue
+            programs += len(self._jobs)
+            batches += 1
+            try:
+                self.sync()
+            except Exception, e:
+                # Keep draining the queue, the backend would block forever.
+                log.exception('Writing %d programs failed', len(self._jobs))
+                self._jobs = []
+        self._update_facets()
+        secs = time.time() - t0
+        stats = {
+            'programs': programs,
+            'batches': batches,
+            'secs': secs,
+            'programs_per_sec': programs / secs if secs else 0,
+            'queue_depth_avg': sum(depth) / len(depth),
+            'queue_depth_max': max(depth),
+            'idle_secs': idle,
+        }
+        stats.update(self._counts)
+        log.info('Wrote %d programs in %d batches in %0.2f secs (%d/sec), queue depth avg %d max %d, '
+                 'writer idle %0.2f secs', programs, batches, secs, stats['programs_per_sec'],
+                 stats['queue_depth_avg'], stats['queue_depth_max'], idle)
+        log.info('%d programs unchanged, %d updated, %d inserted, %d deleted', self._counts['skipped'],
+                 self._counts['updated'], self._counts['inserted'], self._counts['deleted'])
+        return stats
 
 
     def sync(self):
         """
-        Handle waiting add_program jobs.
+        Handle the add_program jobs of the current batch.  Added and deleted
+        programs are collected and written to the db in one batch.
         """
         t0 = time.time()
-        while self._jobs:
-            channel_db_id, start, stop, title, attributes = self._jobs.pop(0)
+        writer = BulkWriter(self._db, 'program')
+        # Group the jobs by channel, keeping the order of arrival.
+        jobs = {}
+        channels = []
+        for job in self._jobs:
+            if job[0] not in jobs:
+                jobs[job[0]] = []
+                channels.append(job[0])
+            jobs[job[0]].append(job)
+        self._jobs = []
+        for channel_db_id in channels:
+            self._sync_channel(channel_db_id, jobs[channel_db_id], writer)
+        deleted, inserted = writer.flush()
+        self._counts['deleted'] += deleted
+        self._counts['inserted'] += inserted
+        self._db.commit()
+        log.info('db commit took %0.3f secs', (time.time() - t0))
+        return False
+
+
+    def _update_facets(self):
+        """
+        Recount the genres of all buckets changed by sync() since the last
+        call.  This is done once after all batches of a backend are written.
+        """
+        if not self._buckets:
+            return
+        t0 = time.time()
+        facets.update_buckets(self._db, self._buckets)
+        self._db.commit()
+        log.info('recounted %d genre buckets in %0.3f secs', len(self._buckets), time.time() - t0)
+        self._buckets = set()
+
+
+    def _sync_channel(self, channel_db_id, jobs, writer):
+        """
+        Merge the add_program jobs of one channel into the db.  All programs
+        of the channel in the time window of the jobs are loaded with one
+        query and kept in lists sorted by start and by stop, so the programs
+        conflicting with a job are found by binary search instead of two
+        queries per job.  Programs added by the writer have a negative
+        temporary id until the writer is flushed.
+
+        Only the columns needed are loaded.  A program with the same start,
+        stop and fingerprint is unchanged, its pickled attributes are never
+        decoded.  The genre count buckets of changed programs are added to
+        self._buckets.
+        """
+        first = min(job[1] for job in jobs)
+        last = max(job[2] for job in jobs)
+        # Superset of all programs that may conflict with a job
+        programs = {}
+        for row in self._db.query(parent = ("channel", channel_db_id), type = "program",
+                                  start = QExpr("<=", last), stop = QExpr(">=", first),
+                                  attrs = [ 'start', 'stop', 'title', 'fingerprint' ]):
+            programs[row['id']] = row
+        starts = sorted((r['start'], r['id']) for r in programs.values())
+        stops = sorted((r['stop'], r['id']) for r in programs.values())
+        for channel_db_id, start, stop, title, attributes in jobs:
+            self._set_identity(title, attributes)
+            attributes['fingerprint'] = fingerprint(title, attributes)
             # Find all programs that have a start or stop during this program
-            # TODO: the two queries take about 0.001 seconds which is too much
-            s1 = self._db.query(parent = ("channel", channel_db_id), type = "program",
-                                start = QExpr("range", (start, stop-1)))
-            s2 = self._db.query(parent = ("channel", channel_db_id), type = "program",
-                                stop = QExpr("range", (start+1, stop)))
+            pos = bisect_left(starts, (start,))
+            s1 = [ programs[i] for s, i in starts[pos:bisect_left(starts, (stop,), pos)] ]
+            pos = bisect_left(stops, (start+1,))
+            s2 = [ programs[i] for s, i in stops[pos:bisect_left(stops, (stop+1,), pos)] ]
             # In a perfect world this program is already in the db and is in s1 and
             # s2 and both lists have a length of 1
             if len(s1) == len(s2) == 1 and start == s1[0]['start'] == s2[0]['start'] and \
                    stop == s1[0]['stop'] == s2[0]['stop']:
                 # yes, update object if it is different
                 current = s1[0]
-                if current['title'] != title or any(attributes[k] != current.get(k) for k in attributes):
-                    log.debug('Updating existing program %s (channel db id=%d, start=%d, stop=%d)',
-                              title, channel_db_id, start, stop)
-                    self._db.update(("program", current["id"]), start = start,
-                                    stop = stop, title = title, **attributes)
+                if current['fingerprint'] == attributes['fingerprint']:
+                    self._counts['skipped'] += 1
+                    continue
+                log.debug('Updating existing program %s (channel db id=%d, start=%d, stop=%d)',
+                          title, channel_db_id, start, stop)
+                writer.update(current["id"], start = start, stop = stop, title = title, **attributes)
+                current = dict(current.items(), title = title, **attributes)
+                programs[current['id']] = current
+                self._counts['updated'] += 1
+                self._buckets.add(start // facets.BUCKET)
                 continue
             # Check for overlapping entries
             removed = []
@@ -242,26 +440,47 @@ class Updater(object):
                     continue
                 log.debug('Removing conflicting program %s (channel db id=%d, start=%d, stop=%d)',
                           r['title'], channel_db_id, r['start'], r['stop'])
-                self._db.delete(("program", r['id']))
+                writer.delete(r['id'])
                 removed.append(r['id'])
+                self._buckets.add(r['start'] // facets.BUCKET)
+                del programs[r['id']]
+                del starts[bisect_left(starts, (r['start'], r['id']))]
+                del stops[bisect_left(stops, (r['stop'], r['id']))]
             # Add the new program
+            self._buckets.add(start // facets.BUCKET)
             log.debug('Adding program %s (channel db id=%d, start=%d, stop=%d)',
                 title, channel_db_id, start, stop)
-            self._db.add("program", parent = ("channel", channel_db_id),
-                         start = start, stop = stop, title = title, **attributes)
-        self._db.commit()
-        log.info('db commit took %0.3f secs', (time.time() - t0))
-        return False
+            row_id = writer.add(("channel", channel_db_id), start = start, stop = stop,
+                                title = title, **attributes)
+            programs[row_id] = dict(attributes, id = row_id, start = start, stop = stop, title = title)
+            insort(starts, (start, row_id))
+            insort(stops, (stop, row_id))
+
+
+    def _set_identity(self, title, attributes):
+        """
+        Set the series_id and program_id attributes of a program.  Ids
+        provided by the source are kept, missing ids are computed from the
+        normalized title, subtitle and episode.
+        """
+        pid = attributes.get('program_id')
+        if pid and not attributes.get('series_id') and pid[:2] in ('EP', 'SH') and len(pid) == 14:
+            # Schedules Direct ids: EP or SH, 8 digits series, 4 digits episode
+            attributes['series_id'] = u'SH' + pid[2:10] + u'0000'
+        if not pid:
+            attributes['program_id'] = program_id(title, attributes.get('subtitle'),
+                                                  attributes.get('episode'), attributes.get('desc'))
+        if not attributes.get('series_id'):
+            attributes['series_id'] = series_id(title)
 
 
     def add_program(self, channel_db_id, start, stop, title, **attributes):
         """
         Add a program to the db. This could cause removing older programs
-        overlapping. This is called by the source update thread.
+        overlapping. This is called by the source update thread, it blocks
+        while the queue of the writer is full.
         """
-        self._jobs.append((channel_db_id, int(start), int(stop), title, attributes))
-        if len(self._jobs) > 5000:
-            self.sync()
+        self._queue.put((channel_db_id, int(start), int(stop), title, attributes))
 
 
 def update(db, backend = None, *args, **kwargs):
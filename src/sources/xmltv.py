@@ -175,6 +175,10 @@ class XmltvParser(object):
         elif name == 'subtitles':
             if attrs['type'] == 'teletext':
                 self._dict['flags'] |= Program.FLAG_CC
+        elif name == 'episode-num' and attrs.get('system') == 'dd_progid':
+            # Schedules Direct program id, e.g. EP00000051.0001
+            self._dict['program_id'] = u''
+            self._current = 'program_id'
         elif name in self.mapping:
             # translate element name using self.mapping
             name = self.mapping[name]
@@ -270,6 +274,8 @@ class XmltvParser(object):
             pass
         except:
             log.error('Exception while processing date', exc_info=True)
+        if 'program_id' in attr:
+            attr['program_id'] = attr['program_id'].strip().replace('.', '')
         # then the start time
         start = timestr2secs_utc(attr.pop('start'))
         # stop time is more complicated, as it is not always given
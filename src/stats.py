@@ -0,0 +1,165 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# stats.py - Query latency statistics
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+
+__all__ = [ 'QueryStats', 'query_shape', 'HISTOGRAM' ]
+
+# python imports
+import time
+import logging
+from bisect import bisect_left
+
+# get logging object
+log = logging.getLogger('epg')
+
+#: Upper bounds in seconds of the latency histogram buckets.  The histogram
+#: has one more bucket for all slower queries.
+HISTOGRAM = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+# Size classes of the channel count and the time window of a query shape
+_CHANNELS = (1, 10, 100)
+_WINDOW = ((3600, '1h'), (6 * 3600, '6h'), (24 * 3600, '1d'), (7 * 24 * 3600, '1w'))
+
+
+def query_shape(name, channels=None, start=None, stop=None, kwargs=None):
+    """
+    Return a string describing the shape of a query: the name, the names
+    of the keyword arguments which are not None and the size classes of the number of channels
+    and of the time window.  Queries of the same shape have a similar cost.
+    """
+    shape = [ name ]
+    names = sorted(k for k, v in (kwargs or {}).items() if v is not None)
+    if names:
+        shape.append(','.join(names))
+    if channels is not None:
+        for size in _CHANNELS:
+            if len(channels) <= size:
+                shape.append('channels<=%d' % size)
+                break
+        else:
+            shape.append('channels>%d' % _CHANNELS[-1])
+    if start is not None:
+        if stop is None or stop <= 0:
+            shape.append('window=open')
+        elif stop <= start:
+            shape.append('window=point')
+        else:
+            for size, label in _WINDOW:
+                if stop - start <= size:
+                    shape.append('window<=%s' % label)
+                    break
+            else:
+                shape.append('window>%s' % _WINDOW[-1][1])
+    return ' '.join(shape)
+
+
+class Measurement(object):
+    """
+    Timing of one query, created by :meth:`QueryStats.measure`.
+    """
+    __slots__ = ('_stats', '_shape', '_start', '_queried')
+
+    def __init__(self, stats, shape):
+        self._stats = stats
+        self._shape = shape
+        self._start = time.time()
+        self._queried = None
+
+    def queried(self):
+        """
+        Mark the end of the database query, the remaining time until
+        :meth:`done` is spent constructing the result objects.
+        """
+        self._queried = time.time()
+
+    def done(self, rows=None):
+        """
+        Record the measurement.
+
+        :param rows: number of rows returned by the query, if known
+        """
+        now = time.time()
+        queried = self._queried or now
+        self._stats.add(self._shape, rows, queried - self._start, now - queried)
+
+
+class QueryStats(object):
+    """
+    Latency statistics of queries grouped by query shape.
+    """
+    def __init__(self, slow_query=None):
+        """
+        :param slow_query: queries taking at least this number of seconds are
+                           logged; None disables the log
+        """
+        self.slow_query = slow_query
+        self._shapes = {}
+
+    def measure(self, name, channels=None, start=None, stop=None, kwargs=None):
+        """
+        Start timing a query, see :func:`query_shape` for the arguments.
+
+        :return: :class:`Measurement` object
+        """
+        return Measurement(self, query_shape(name, channels, start, stop, kwargs))
+
+    def add(self, shape, rows, query_time, build_time):
+        """
+        Add the times of a query of the given shape.
+        """
+        stats = self._shapes.get(shape)
+        if stats is None:
+            stats = self._shapes[shape] = {
+                'count': 0, 'rows': 0, 'query_time': 0.0, 'build_time': 0.0, 'max_time': 0.0,
+                'histogram': [ 0 ] * (len(HISTOGRAM) + 1)
+            }
+        total = query_time + build_time
+        stats['count'] += 1
+        stats['rows'] += rows or 0
+        stats['query_time'] += query_time
+        stats['build_time'] += build_time
+        stats['max_time'] = max(stats['max_time'], total)
+        stats['histogram'][bisect_left(HISTOGRAM, total)] += 1
+        if self.slow_query is not None and total >= self.slow_query:
+            log.warning('slow query %s: %0.3f secs (query %0.3f, objects %0.3f), %s rows',
+                        shape, total, query_time, build_time, rows)
+
+    def get(self, reset=False):
+        """
+        Return the statistics as a dict with the histogram bounds as
+        ``histogram`` and a dict mapping the query shapes to dicts with
+        the keys ``count``, ``rows``, ``query_time`` and ``build_time``
+        (sums), ``max_time`` and ``histogram`` (list of counts) as
+        ``queries``.
+
+        :param reset: clear the statistics afterwards
+        """
+        queries = dict((shape, dict(stats, histogram=stats['histogram'][:]))
+                       for shape, stats in self._shapes.items())
+        if reset:
+            self._shapes = {}
+        return { 'histogram': HISTOGRAM, 'queries': queries }
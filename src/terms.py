@@ -0,0 +1,97 @@
+# -*- coding: iso-8859-1 -*-
+# -----------------------------------------------------------------------------
+# terms.py - In-memory prefix completion of keywords and titles
+# -----------------------------------------------------------------------------
+# $Id$
+# -----------------------------------------------------------------------------
+# kaa.epg - EPG Database
+# Copyright (C) 2004-2008 Jason Tackaberry, Dirk Meyer, Rob Shortt
+#
+# Please see the file AUTHORS for a complete list of authors.
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version
+# 2.1 as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301 USA
+#
+# -----------------------------------------------------------------------------
+
+__all__ = [ 'TermIndex' ]
+
+# python imports
+import heapq
+from bisect import bisect_left
+
+# kaa.epg imports
+from util import normalize_title
+
+
+class TermIndex(object):
+    """
+    Sorted array of normalized terms with their frequencies.
+
+    A prefix maps to a contiguous range of the array, which is found with
+    two binary searches.  The most frequent terms of that range are
+    returned.  Results for short prefixes cover large ranges and are
+    cached, since they are requested on every first keystroke.
+    """
+    #: Results of prefixes up to this length are cached.
+    cache_prefix_length = 2
+
+    def __init__(self, terms, normalize=True):
+        """
+        :param terms: iterable of (term, count) tuples; the counts of equal
+                      terms are added up
+        :param normalize: normalize the terms and the prefixes to complete,
+                          otherwise they are used as they are
+        """
+        self._normalize = normalize
+        counts = {}
+        for term, count in terms:
+            if normalize:
+                term = normalize_title(term)
+            if term and count > 0:
+                counts[term] = counts.get(term, 0) + count
+        self._terms = sorted(counts.keys())
+        self._counts = [ counts[t] for t in self._terms ]
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._terms)
+
+    def items(self):
+        """
+        Return all (term, count) tuples sorted by term.
+        """
+        return zip(self._terms, self._counts)
+
+    def complete(self, prefix, limit=10):
+        """
+        Return up to limit (term, count) tuples of terms starting with
+        prefix, the most frequent first.  If limit is None, all terms
+        starting with prefix are returned.
+        """
+        if self._normalize:
+            prefix = normalize_title(prefix)
+        key = prefix, limit
+        if key in self._cache:
+            return self._cache[key][:]
+        lo = bisect_left(self._terms, prefix)
+        hi = bisect_left(self._terms, prefix + u'\uffff', lo)
+        if limit is not None and hi - lo > limit:
+            positions = heapq.nlargest(limit, xrange(lo, hi), key=self._counts.__getitem__)
+        else:
+            positions = sorted(xrange(lo, hi), key=self._counts.__getitem__, reverse=True)
+        result = [ (self._terms[pos], self._counts[pos]) for pos in positions ]
+        if len(prefix) <= self.cache_prefix_length:
+            self._cache[key] = result[:]
+        return result
@@ -27,59 +27,73 @@
 #
 # -----------------------------------------------------------------------------
 
+import re
 import time
+import hashlib
+import unicodedata
 
 class EPGError(Exception):
     pass
 
-def cmp_channel(c1, c2):
+def normalize_title(title):
     """
-    Compare two channels for sorting.
-    FIXME: a channel should have an sort number as attribute the user
-    can change.
+    Normalize a title for comparison: lowercase, no accents, punctuation or
+    redundant whitespace.
     """
-    l1 = len(c1.tuner_id)
-    l2 = len(c2.tuner_id)
+    if not title:
+        return u''
+    title = unicodedata.normalize('NFKD', unicode(title))
+    title = u''.join(c for c in title if not unicodedata.combining(c)).lower()
+    return u' '.join(re.sub(r'[^\w\s]', u' ', title, flags=re.UNICODE).split())
 
-    if l1 == 0:
-        if l2 == 0:
-            return 0
-        else:
-            return -1
+def _hash(*values):
+    return unicode(hashlib.md5(u'\0'.join(values).encode('utf-8')).hexdigest()[:16])
 
-    if l2 == 0:
-        if l1 == 0:
-            return 0
-        else:
-            return 1
+def series_id(title):
+    """
+    Return the series id computed from a title.  It is used for programs
+    whose source provides no id.
+    """
+    return _hash(u'series', normalize_title(title))
 
-    a = 0
-    b = 0
+def program_id(title, subtitle=None, episode=None, desc=None):
+    """
+    Return the program id computed from the normalized title, subtitle and
+    episode.  If there is neither subtitle nor episode, the description is
+    used to tell episodes apart.
+    """
+    values = [ normalize_title(title), normalize_title(subtitle), normalize_title(episode) ]
+    if not values[1] and not values[2]:
+        values.append(normalize_title(desc))
+    return _hash(u'program', *values)
 
-    for t in c1.tuner_id:
-        try:
-            a = int(t)
-            break
-        except:
-            if c1.tuner_id.index(t) < l1-1:
-                # try next time
-                continue
-            else:
-                break
+def fingerprint(title, attributes):
+    """
+    Return a hash of the title and all attributes of a program as integer.
+    The updater stores it with the program to recognize unchanged programs
+    without loading their attributes.
+    """
+    values = sorted((k, v) for k, v in attributes.items() if v is not None and k != 'fingerprint')
+    return int(hashlib.md5(repr((title, values))).hexdigest()[:15], 16)
 
-    for t in c2.tuner_id:
-        try:
-            b = int(t)
-            break
-        except:
-            if c2.tuner_id.index(t) < l2-1:
-                # try next time
-                continue
-            else:
-                break
+def channel_sort_key(channel):
+    """
+    Return the key used to sort channels.
 
-    if a < b:
-        return -1
-    if a > b:
-        return 1
-    return 0
+    Channels are sorted by their sort_number if the user has set one, or
+    otherwise by the first numeric tuner id.  Channels without tuner ids
+    come first.  The channel name is used to order channels with the same
+    number.
+    """
+    number = getattr(channel, 'sort_number', None)
+    if number is None:
+        if not channel.tuner_id:
+            return 0, 0, channel.name
+        number = 0
+        for t in channel.tuner_id:
+            try:
+                number = int(t)
+                break
+            except (TypeError, ValueError):
+                pass
+    return 1, number, channel.name
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import random
+import tempfile
+
+import kaa
+import kaa.epg
+
+# Benchmark time-window searches with and without the interval index on a
+# synthetic multi-week guide.
+#
+# usage: bench_index.py [channels] [days]
+
+CHANNELS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+DAYS = int(sys.argv[2]) if len(sys.argv) > 2 else 14
+LOOPS = 50
+
+def populate(guide):
+    db = guide._db
+    random.seed(0)
+    base = int(time.time()) / 3600 * 3600
+    for c in range(CHANNELS):
+        channel_id = db.add('channel', tuner_id=[str(c+1)], name=u'C%d' % c, long_name=u'Channel %d' % c)['id']
+        t = base
+        while t < base + DAYS * 24 * 60 * 60:
+            if c == 0 and t % 86400 > 82800:
+                # One 12 hour overnight program kills the old heuristic.
+                length = 12 * 60 * 60
+            else:
+                length = random.choice((15, 30, 30, 60, 60, 90, 120)) * 60
+            db.add('program', parent=('channel', channel_id), start=t, stop=t+length,
+                   title=u'Program %d' % t, desc=u'Description')
+            t += length
+    row = db._db_query_row('SELECT count(*) FROM objects_program')
+    db.set_metadata('kaa.epg::num_programs', row[0])
+    row = db._db_query_row('SELECT stop-start AS length FROM objects_program ORDER BY length DESC LIMIT 1')
+    db.set_metadata('kaa.epg::max_program_length', row[0])
+    db.commit()
+    guide._sync()
+    return base
+
+def bench(guide, base, use_index):
+    guide.use_interval_index = use_index
+    channels = guide.get_channels()
+    t0 = time.time()
+    for i in range(LOOPS):
+        t = base + random.randint(0, DAYS * 24 * 60 * 60)
+        now = guide.search(time=t).wait()
+        grid = guide.search(channels[:10], time=(t, t + 3 * 60 * 60)).wait()
+    return (time.time() - t0) / LOOPS, len(now), len(grid)
+
+dbfile = os.path.join(tempfile.mkdtemp(), 'bench.db')
+guide = kaa.epg.load(dbfile)
+t0 = time.time()
+base = populate(guide)
+print 'populated %d programs in %0.2f secs' % (guide.num_programs, time.time() - t0)
+t0 = time.time()
+guide._get_index()
+print 'index built in %0.3f secs' % (time.time() - t0)
+for use_index in (False, True):
+    random.seed(1)
+    secs, now, grid = bench(guide, base, use_index)
+    print 'interval index %-5s: %0.4f secs per now+grid query (%d now, %d grid rows)' % \
+          (use_index, secs, now, grid)
+os.unlink(dbfile)
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import random
+import tempfile
+
+import kaa
+import kaa.epg
+
+# Benchmark plan_recordings with hundreds of favorites on a synthetic
+# multi-week guide.  Most favorites are plain titles, some are channel
+# bound keyword searches.
+#
+# usage: bench_planner.py [channels] [days] [favorites]
+
+CHANNELS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+DAYS = int(sys.argv[2]) if len(sys.argv) > 2 else 14
+FAVORITES = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+SERIES = 2000
+
+def populate(guide):
+    db = guide._db
+    random.seed(0)
+    base = int(time.time()) / 3600 * 3600
+    for c in range(CHANNELS):
+        channel_id = db.add('channel', tuner_id=[str(c+1)], name=u'C%d' % c, long_name=u'Channel %d' % c)['id']
+        t = base
+        while t < base + DAYS * 24 * 60 * 60:
+            length = random.choice((30, 30, 60, 60, 90)) * 60
+            series = random.randint(0, SERIES)
+            db.add('program', parent=('channel', channel_id), start=t, stop=t+length,
+                   title=u'Series %d' % series, desc=u'Episode of series %d' % series)
+            t += length
+    row = db._db_query_row('SELECT count(*) FROM objects_program')
+    db.set_metadata('kaa.epg::num_programs', row[0])
+    db.set_metadata('kaa.epg::max_program_length', 90 * 60)
+    db.commit()
+    guide._sync()
+
+dbfile = os.path.join(tempfile.mkdtemp(), 'bench.db')
+guide = kaa.epg.load(dbfile)
+t0 = time.time()
+populate(guide)
+print 'populated %d programs in %0.2f secs' % (guide.num_programs, time.time() - t0)
+
+channels = guide.get_channels()
+requests = []
+for i in range(FAVORITES):
+    if i % 10:
+        requests.append({'title': u'Series %d' % random.randint(0, SERIES)})
+    else:
+        requests.append({'keywords': u'%d' % random.randint(0, SERIES), 'channel': random.choice(channels),
+                         'priority': 1})
+for tuners in (1, 2, 4):
+    t0 = time.time()
+    scheduled, conflicts = guide.plan_recordings(requests, tuners, padding=60).wait()
+    print '%d tuners: %d scheduled, %d conflicts in %0.3f secs' % \
+          (tuners, len(scheduled), len(conflicts), time.time() - t0)
+os.unlink(dbfile)
@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime
+
+import kaa
+import kaa.dateutils
+import kaa.epg
+
+# Benchmark construction time and memory per object of kaa.epg.Program
+# against the old implementation that materialized all attributes into the
+# instance dict on first access.  Grid views typically only read the title
+# and the start timestamp.
+#
+# usage: bench_program.py [programs]
+
+PROGRAMS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+class LegacyProgram(object):
+    def __init__(self, channel, dbdata, extrainfo):
+        self.channel = channel
+        self._dbdata = dbdata
+        if extrainfo:
+            self.__dict__.update(extrainfo)
+
+    def __getattr__(self, attr):
+        if hasattr(self, '_dbdata') and attr != '_dbdata':
+            self.db_id = self._dbdata.get('type'), self._dbdata.get('id')
+            self.start_timestamp = self._dbdata.get('start', 0)
+            self.stop_timestamp = self._dbdata.get('stop', 0)
+            self.start = datetime.fromtimestamp(self.start_timestamp, kaa.dateutils.local)
+            self.stop = datetime.fromtimestamp(self.stop_timestamp, kaa.dateutils.local)
+            self.title = self._dbdata.get('title', u'')
+            self.description = self._dbdata.get('desc', u'')
+            self.subtitle = self._dbdata.get('subtitle',  u'')
+            self.episode = self._dbdata.get('episode')
+            self.genres = self._dbdata.get('genres', [])
+            self.advisories = self._dbdata.get('advisories', [])
+            self.rating = self._dbdata.get('rating')
+            self.score = self._dbdata.get('score')
+            self.flags = self._dbdata.get('flags')
+            self.credits = self._dbdata.get('credits')
+            self.date = self._dbdata.get('date')
+            self.year = self._dbdata.get('year')
+            del self._dbdata
+        return self.__getattribute__(attr)
+
+def populate(guide):
+    db = guide._db
+    base = int(time.time()) / 3600 * 3600
+    channel_id = db.add('channel', tuner_id=[u'1'], name=u'C1', long_name=u'Channel 1')['id']
+    for i in range(PROGRAMS):
+        t = base + i * 60
+        db.add('program', parent=('channel', channel_id), start=t, stop=t+60,
+               title=u'Program %d' % i, desc=u'Description', genres=[u'News'])
+    db.set_metadata('kaa.epg::num_programs', PROGRAMS)
+    db.set_metadata('kaa.epg::max_program_length', 60)
+    db.commit()
+    guide._sync()
+
+def sizeof(obj):
+    size = sys.getsizeof(obj)
+    # Accessing __dict__ of a __slots__ object would create it.
+    if not hasattr(type(obj), '__slots__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+def bench(cls, rows):
+    t0 = time.time()
+    programs = [ cls(channel, row, None) for row in rows ]
+    construct = time.time() - t0
+    t0 = time.time()
+    for p in programs:
+        p.title, p.start_timestamp
+    grid = time.time() - t0
+    t0 = time.time()
+    for p in programs:
+        p.start, p.stop
+    dates = time.time() - t0
+    size = sum(sizeof(p) for p in programs) / float(len(programs))
+    print '%-13s: construct %0.4f, title+timestamp %0.4f, datetimes %0.4f secs, %d bytes per object' % \
+          (cls.__name__, construct, grid, dates, size)
+
+dbfile = os.path.join(tempfile.mkdtemp(), 'bench.db')
+guide = kaa.epg.load(dbfile)
+populate(guide)
+channel = guide.get_channels()[0]
+for cls in (LegacyProgram, kaa.epg.Program):
+    # Fetch fresh rows for every run so pickles are decoded in both runs.
+    rows = guide.search(cls=None).wait()[0]
+    bench(cls, rows)
+os.unlink(dbfile)
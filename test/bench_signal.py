@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import tempfile
+
+import kaa
+import kaa.epg
+
+# Benchmark per-row program-retrieved against batched programs-retrieved
+# dispatch of the rows of a large search.  Only the dispatch is timed, the
+# query itself is done once up front.  All callbacks mark programs that are
+# scheduled for recording with one set lookup per row.
+#
+# usage: bench_signal.py [programs]
+
+PROGRAMS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+LOOPS = 10
+
+def populate(guide):
+    db = guide._db
+    base = int(time.time()) / 3600 * 3600
+    channel_id = db.add('channel', tuner_id=[u'1'], name=u'C1', long_name=u'Channel 1')['id']
+    for i in range(PROGRAMS):
+        t = base + i * 60
+        db.add('program', parent=('channel', channel_id), start=t, stop=t+60, title=u'Program %d' % i)
+    db.set_metadata('kaa.epg::num_programs', PROGRAMS)
+    db.set_metadata('kaa.epg::max_program_length', 60)
+    db.commit()
+    guide._sync()
+    return base
+
+# every tenth program is scheduled
+scheduled = set()
+
+def per_row(row, extra_info):
+    if row['id'] in scheduled:
+        extra_info['scheduled'] = True
+
+def batched(rows, extra_infos):
+    for i, row in enumerate(rows):
+        if row['id'] in scheduled:
+            extra_infos[i]['scheduled'] = True
+
+def bench(guide, rows, signal, callback):
+    guide.signals[signal].connect(callback)
+    t0 = time.time()
+    for i in range(LOOPS):
+        extra_data = guide._emit_retrieved(rows)
+    secs = (time.time() - t0) / LOOPS
+    guide.signals[signal].disconnect(callback)
+    marked = len([e for e in extra_data or [] if e and e.get('scheduled')])
+    return secs, marked
+
+dbfile = os.path.join(tempfile.mkdtemp(), 'bench.db')
+guide = kaa.epg.load(dbfile)
+base = populate(guide)
+rows, extra_data = guide.search(time=(base, base + PROGRAMS * 60), cls=None).wait()
+scheduled.update(row['id'] for row in rows[::10])
+for signal, callback in (('program-retrieved', per_row), ('programs-retrieved', batched)):
+    secs, marked = bench(guide, rows, signal, callback)
+    print '%-18s: %0.6f secs per dispatch (%d programs, %d scheduled)' % (signal, secs, len(rows), marked)
+os.unlink(dbfile)
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+import kaa
+import kaa.epg
+from kaa.epg import metadata
+
+# Measure the cold start time of kaa.epg.load() in a fresh process with and
+# without the channel snapshot that is written at the end of an update.
+#
+# usage: bench_startup.py [channels] [runs]
+
+CHANNELS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+RUNS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+LOAD = '''
+import sys, time
+import kaa.epg
+t0 = time.time()
+kaa.epg.load(sys.argv[1])
+channels = kaa.epg.get_channels(sort=True)
+print time.time() - t0
+'''
+
+def populate(guide):
+    db = guide._db
+    base = int(time.time()) / 3600 * 3600
+    for c in range(CHANNELS):
+        channel_id = db.add('channel', tuner_id=[str(c+1), 'S%d' % c], name=u'C%d' % c,
+                            long_name=u'Channel %d' % c)['id']
+        for i in range(24):
+            db.add('program', parent=('channel', channel_id), start=base+i*3600, stop=base+(i+1)*3600,
+                   title=u'Program %d' % i)
+    db.set_metadata('kaa.epg::num_programs', CHANNELS * 24)
+    db.set_metadata('kaa.epg::max_program_length', 3600)
+    db.commit()
+
+def load(dbfile):
+    times = []
+    for i in range(RUNS):
+        output = subprocess.check_output([sys.executable, '-c', LOAD, dbfile])
+        times.append(float(output.strip().split()[-1]))
+    return min(times), sum(times) / len(times)
+
+dbfile = os.path.join(tempfile.mkdtemp(), 'bench.db')
+guide = kaa.epg.load(dbfile)
+populate(guide)
+print 'populated %d channels' % CHANNELS
+print 'without snapshot: min %0.4f, avg %0.4f secs' % load(dbfile)
+# As done at the end of an update
+metadata.write_snapshot(guide._db)
+guide._db.commit()
+print 'with snapshot:    min %0.4f, avg %0.4f secs' % load(dbfile)
+os.unlink(dbfile)
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import random
+import tempfile
+
+import kaa
+import kaa.epg
+from kaa.db import QExpr
+import kaa.epg.sources
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+# Compare Updater.sync with the old implementation using two queries per
+# program on synthetic data: a first import, an import of unchanged data
+# and an import with a shifted schedule causing conflicts.  Both must
+# produce the same programs and inverted indexes.
+#
+# usage: bench_sync.py [channels] [days]
+
+CHANNELS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+DAYS = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+
+Updater = sys.modules['kaa.epg.sources.update'].Updater
+
+class LegacyUpdater(Updater):
+    def sync(self):
+        while self._jobs:
+            channel_db_id, start, stop, title, attributes = self._jobs.pop(0)
+            self._set_identity(title, attributes)
+            s1 = self._db.query(parent = ("channel", channel_db_id), type = "program",
+                                start = QExpr("range", (start, stop-1)))
+            s2 = self._db.query(parent = ("channel", channel_db_id), type = "program",
+                                stop = QExpr("range", (start+1, stop)))
+            if len(s1) == len(s2) == 1 and start == s1[0]['start'] == s2[0]['start'] and \
+                   stop == s1[0]['stop'] == s2[0]['stop']:
+                current = s1[0]
+                if current['title'] != title or any(attributes[k] != current.get(k) for k in attributes):
+                    self._db.update(("program", current["id"]), start = start,
+                                    stop = stop, title = title, **attributes)
+                continue
+            removed = []
+            for r in s1 + s2:
+                if r['id'] in removed:
+                    continue
+                self._db.delete(("program", r['id']))
+                removed.append(r['id'])
+            self._db.add("program", parent = ("channel", channel_db_id),
+                         start = start, stop = stop, title = title, **attributes)
+        self._db.commit()
+
+def feed(updater, dataset, shift=0):
+    """
+    Queue all programs of the data set, moving every third program by
+    shift seconds.
+    """
+    channels = {}
+    for channel in dataset.channels():
+        channels[channel['station']] = updater.add_channel(channel['station'], unicode(channel['callsign']),
+                                                           unicode(channel['name']))
+    for n, (channel, start, stop, program_id) in enumerate(dataset.airings()):
+        program = dataset.program(program_id)
+        if shift and n % 3 == 0:
+            start, stop = start + shift, stop + shift
+        updater._jobs.append((channels[channel['station']], start, stop, unicode(program['title']),
+                              dict(desc=unicode(program['desc']), subtitle=unicode(program['subtitle']),
+                                   genres=[ unicode(g) for g in program['genres'] ],
+                                   program_id=unicode(program_id))))
+
+def programs(db):
+    return sorted((r['parent_id'], r['start'], r['stop'], r['title'], r['desc'], r['subtitle'],
+                   r['genres'], r['program_id'], r['series_id']) for r in db.query(type='program'))
+
+def terms(db):
+    result = []
+    for ivtidx in 'keywords', 'genres':
+        result.append(db._db_query_row("SELECT value FROM inverted_indexes WHERE name=? AND attr='objectcount'",
+                                       (ivtidx,))[0])
+        result.append(db._db_query('SELECT term, count FROM ivtidx_%s_terms WHERE count > 0 ORDER BY term' % ivtidx))
+        result.append(db._db_query('''SELECT p.parent_id, p.start, t.term, m.rank, m.frequency
+                                        FROM ivtidx_%s_terms_map m, ivtidx_%s_terms t, objects_program p
+                                       WHERE m.term_id = t.id AND m.object_id = p.id
+                                    ORDER BY 1, 2, 3''' % (ivtidx, ivtidx)))
+    return result
+
+dataset = synthetic.Dataset(CHANNELS, DAYS)
+guides = []
+for cls in LegacyUpdater, Updater:
+    guide = kaa.epg.load(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    guides.append(guide)
+    for name, shift in (('import', 0), ('unchanged', 0), ('conflicts', 600)):
+        updater = cls(guide._db)
+        feed(updater, dataset, shift)
+        jobs = len(updater._jobs)
+        t0 = time.time()
+        updater.sync()
+        updater._update_facets()
+        print '%-14s %-10s %6d programs in %0.2f secs' % (cls.__name__, name, jobs, time.time() - t0)
+print 'same programs:', programs(guides[0]._db) == programs(guides[1]._db)
+print 'same terms:', terms(guides[0]._db) == terms(guides[1]._db)
+for guide in guides:
+    os.unlink(guide._db._dbfile)
@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import optparse
+
+import kaa
+import kaa.epg
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+# Benchmark suite for the hot paths of kaa.epg on synthetic data: ingest
+# through the update backends, now/next, grid, keyword and genre searches,
+# RPC round trips and memory.  The results are written as JSON and can be
+# compared against an earlier run to catch regressions.
+#
+# usage: benchmark.py [options]
+#
+#   benchmark.py --channels 100 --days 7 --output base.json
+#   ... change the code ...
+#   benchmark.py --channels 100 --days 7 --compare base.json
+
+def timeit(func, runs):
+    """
+    Call func runs times and return the timings in seconds.
+    """
+    times = []
+    for i in range(runs):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return times
+
+def summary(times, **extra):
+    times = sorted(times)
+    result = {
+        'runs': len(times),
+        'min': times[0],
+        'median': times[len(times) / 2],
+        'max': times[-1],
+    }
+    result.update(extra)
+    return result
+
+def memory():
+    """
+    Return the current and the peak resident set size in KB.
+    """
+    current = None
+    try:
+        current = int(open('/proc/self/statm').read().split()[1]) * resource.getpagesize() / 1024
+    except (IOError, IndexError, ValueError):
+        pass
+    return { 'rss_kb': current, 'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss }
+
+
+class SyncTimer(object):
+    """
+    Measure the time spent in Updater.sync, i.e. merging the parsed
+    programs into the database.
+    """
+    def __init__(self):
+        import kaa.epg.sources
+        self.updater = sys.modules['kaa.epg.sources.update'].Updater
+        self.sync = self.updater.sync
+        self.secs = 0.0
+        timer = self
+        def sync(self):
+            t0 = time.time()
+            try:
+                return timer.sync(self)
+            finally:
+                timer.secs += time.time() - t0
+        self.updater.sync = sync
+
+    def restore(self):
+        self.updater.sync = self.sync
+
+
+def ingest(guide, source, filename, dataset):
+    """
+    Run an update using the given backend on the synthetic file.
+    """
+    timer = SyncTimer()
+    try:
+        t0 = time.time()
+        if source == 'schedulesdirect':
+            # Replace the download by a copy of the synthetic file, the
+            # backend deletes it after parsing.
+            from kaa.epg.sources import schedulesdirect
+            request = schedulesdirect.request
+            copy = filename + '.download'
+            shutil.copy(filename, copy)
+            schedulesdirect.request = lambda *args, **kwargs: copy
+            try:
+                guide.update(source, dataset.start, dataset.stop).wait()
+            finally:
+                schedulesdirect.request = request
+        else:
+            guide.update(source, filename).wait()
+        secs = time.time() - t0
+    finally:
+        timer.restore()
+    return { 'secs': secs, 'sync_secs': timer.secs, 'programs': guide.num_programs }
+
+
+def run_queries(guide, dataset, runs):
+    """
+    Time the query hot paths and return a dict of results.
+    """
+    results = {}
+    rnd = random.Random(0)
+    channels = guide.get_channels(sort=True)
+    now = time.time()
+    times = [ rnd.randint(dataset.start, dataset.stop) for i in range(runs) ]
+
+    # The first call creates the now/next table, later calls use it.
+    results['now_next_cold'] = summary(timeit(lambda: guide.get_now_next().wait(), 1))
+    results['now_next'] = summary(timeit(lambda: guide.get_now_next().wait(), runs))
+
+    def grid():
+        start = times.pop(0) if times else now
+        return guide.get_grid(channels[:20], start, start + 3 * 3600).wait()
+    results['grid'] = summary(timeit(grid, runs), channels=min(20, len(channels)), hours=3)
+
+    results['search_time'] = summary(timeit(lambda: guide.search(time=now).wait(), runs),
+                                     rows=len(guide.search(time=now).wait()))
+
+    words = [ rnd.choice(synthetic.WORDS) for i in range(runs) ]
+    rows = []
+    def keywords():
+        rows.append(len(guide.search(keywords=unicode(words[len(rows) % len(words)])).wait()))
+    results['search_keywords'] = summary(timeit(keywords, runs), rows=sum(rows) / max(len(rows), 1))
+
+    genres = [ rnd.choice(synthetic.GENRES) for i in range(runs) ]
+    rows = []
+    def genre():
+        start = rnd.randint(dataset.start, dataset.stop)
+        rows.append(len(guide.search(genres=unicode(genres[len(rows) % len(genres)]),
+                                     time=(start, start + 24 * 3600)).wait()))
+    results['search_genres'] = summary(timeit(genre, runs), rows=sum(rows) / max(len(rows), 1))
+    return results
+
+
+@kaa.coroutine()
+def run_rpc(guide, runs):
+    """
+    Time RPC round trips to a server in the same process.
+    """
+    from kaa.epg.rpc import Server, Client
+    address = ('localhost', 17000 + os.getpid() % 1000)
+    server = Server(guide, address, 'benchmark')
+    client = Client(address, 'benchmark')
+    yield kaa.inprogress(client.signals['connected'])
+    channels = client.get_channels(sort=True)
+    now = time.time()
+    results = {}
+    for name, call in (('rpc_search_time', lambda: client.search(time=now)),
+                       ('rpc_now_next', lambda: client.get_now_next()),
+                       ('rpc_grid', lambda: client.get_grid(channels[:20], now, now + 3 * 3600))):
+        times = []
+        for i in range(runs):
+            t0 = time.time()
+            yield call()
+            times.append(time.time() - t0)
+        results[name] = summary(times)
+    client.channel.close()
+    yield results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change of all timings against a baseline and return the
+    number of regressions above threshold.
+    """
+    regressions = 0
+    for name, value in sorted(results['results'].items()):
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            continue
+        key = 'median' if 'median' in value else 'secs'
+        if not old.get(key):
+            continue
+        change = value[key] / old[key] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print '%-20s %10.5f -> %10.5f  %+6.1f%%%s' % (name, old[key], value[key], change * 100, flag)
+    return regressions
+
+
+def main():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--channels', type='int', default=50, help='number of channels [%default]')
+    parser.add_option('--days', type='int', default=7, help='number of days [%default]')
+    parser.add_option('--density', type='float', default=1.0,
+                      help='average number of programs per hour and channel [%default]')
+    parser.add_option('--source', default='xmltv', choices=list(synthetic.WRITERS),
+                      help='update backend used for ingest [%default]')
+    parser.add_option('--runs', type='int', default=20, help='number of runs per query [%default]')
+    parser.add_option('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_option('--compare', help='compare the results with an earlier JSON output')
+    parser.add_option('--threshold', type='float', default=0.2,
+                      help='relative slowdown reported as regression [%default]')
+    options, args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        dataset = synthetic.Dataset(options.channels, options.days, options.density)
+        filename = os.path.join(tmpdir, 'guide.xml')
+        if options.source == 'schedulesdirect':
+            filename += '.gz'
+        t0 = time.time()
+        synthetic.write(dataset, options.source, filename)
+        results = { 'generate': { 'secs': time.time() - t0, 'bytes': os.path.getsize(filename) } }
+
+        guide = kaa.epg.load(os.path.join(tmpdir, 'epg.db'))
+        results['ingest'] = ingest(guide, options.source, filename, dataset)
+        # Same data again, all programs are already in the database.
+        results['reingest'] = ingest(guide, options.source, filename, dataset)
+        results['memory_ingest'] = memory()
+        results.update(run_queries(guide, dataset, options.runs))
+        results.update(run_rpc(guide, options.runs).wait())
+        results['memory'] = memory()
+    finally:
+        shutil.rmtree(tmpdir)
+
+    output = {
+        'params': {
+            'channels': options.channels,
+            'days': options.days,
+            'density': options.density,
+            'source': options.source,
+            'runs': options.runs,
+        },
+        'created': int(time.time()),
+        'results': results,
+    }
+    data = json.dumps(output, indent=2, sort_keys=True)
+    if options.output:
+        open(options.output, 'w').write(data + '\n')
+    elif not options.compare:
+        print data
+    if options.compare:
+        baseline = json.load(open(options.compare))
+        if baseline.get('params') != output['params']:
+            print 'warning: parameters differ from the baseline'
+        if compare(output, baseline, options.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -18,20 +18,13 @@ def remote():
 
 def test():
     channels = kaa.epg.get_channels()
-    programs= kaa.epg.search(channels[:2], time=(time.time(), time.time() + (3 * 60 * 60))).wait()
+    grid = kaa.epg.get_grid(channels[:2], time.time(), time.time() + (3 * 60 * 60)).wait()
 
-    #Separate into grid arrays
-    channel_programs = [[], []]
-    map_channel_programs = {channels[0]:channel_programs[0], channels[1]:channel_programs[1]}
-    for program in programs:
-        map_channel_programs[program.channel].append(program)
-
-
-    for i,programs in enumerate(channel_programs):
-        print channels[i].name, len(programs)
+    for channel, programs in grid.items():
+        print channel.name, len(programs)
         for program in programs:
             print 'Title:', program.title, '(', program.start, '->', program.stop, ')'
-            assert(program.channel == channels[i])
+            assert(program.channel == channel)
             assert(hasattr(program, 'test'))
             assert(program.test == 'db_id : %d' % program.db_id[1])
         print
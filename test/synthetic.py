@@ -0,0 +1,213 @@
+import sys
+import time
+import gzip
+import random
+import optparse
+from xml.sax.saxutils import escape, quoteattr
+
+# Generator of reproducible synthetic EPG data in XMLTV and Schedules Direct
+# (XTVD) format.  The size is given by the number of channels, the number of
+# days and the program density (average number of programs per hour and
+# channel).  The same seed always produces the same data.
+#
+# usage: synthetic.py [options] xmltv|schedulesdirect FILE
+#
+# FILE is written gzip compressed if it ends with .gz, the Schedules Direct
+# backend expects a compressed file.
+
+WORDS = '''news weather sport world report live today night morning evening
+    street city house family doctor police fire island river mountain ocean
+    kitchen garden market science history nature planet space secret story
+    legend king queen castle journey road train station hotel school college
+    music dance comedy drama mystery crime murder detective lawyer judge court
+    money business show game quiz star hero friend brother sister love summer
+    winter spring autumn storm shadow light dark gold silver'''.split()
+
+GENRES = [ 'News', 'Sports', 'Movie', 'Comedy', 'Drama', 'Documentary', 'Children',
+           'Music', 'Reality', 'Talk', 'Crime', 'Science fiction' ]
+
+# Program lengths relative to the average length given by the density
+LENGTHS = (0.5, 0.5, 1, 1, 1, 1.5, 2)
+
+
+class Dataset(object):
+    """
+    Synthetic guide data.  Programs are generated on the fly, so the data
+    set is never kept in memory.
+    """
+    def __init__(self, channels=50, days=7, density=1.0, start=None, seed=0):
+        self.num_channels = channels
+        self.days = days
+        self.density = density
+        self.seed = seed
+        if start is None:
+            start = int(time.time()) / 3600 * 3600 - 3600
+        self.start = start
+        self.stop = start + days * 24 * 3600
+        # About 20 airings per series
+        self.num_series = max(10, int(channels * days * 24 * density / 20))
+
+    def channels(self):
+        """
+        Return a list of channel dicts.
+        """
+        channels = []
+        for n in range(self.num_channels):
+            letters, i = '', n
+            while True:
+                letters = chr(ord('A') + i % 26) + letters
+                i = i / 26 - 1
+                if i < 0:
+                    break
+            channels.append({
+                'number': n + 1,
+                'station': str(10000 + n),
+                'callsign': 'SYN' + letters,
+                'name': 'Synthetic Channel %d' % (n + 1),
+            })
+        return channels
+
+    def airings(self):
+        """
+        Yield (channel, start, stop, program_id) tuples sorted by channel and
+        start time.  The programs of a channel do not overlap.
+        """
+        rnd = random.Random(self.seed)
+        unit = 3600 / self.density
+        for channel in self.channels():
+            t = self.start
+            while t < self.stop:
+                length = max(300, int(rnd.choice(LENGTHS) * unit) / 300 * 300)
+                series = rnd.randrange(self.num_series)
+                # Few episodes per series, so some programs are repeated.
+                episode = rnd.randrange(1, 40)
+                yield channel, t, t + length, 'EP%08d%04d' % (series, episode)
+                t += length
+
+    def program(self, program_id):
+        """
+        Return the program dict of a Schedules Direct style program id.
+        """
+        series, episode = int(program_id[2:10]), int(program_id[10:])
+        rnd = random.Random(series)
+        title = ' '.join(rnd.choice(WORDS) for i in range(rnd.randint(1, 3))).title()
+        program = {
+            'id': program_id,
+            'title': '%s %d' % (title, series),
+            'genres': rnd.sample(GENRES, rnd.randint(1, 2)),
+            'year': rnd.randint(1960, 2025),
+            'episode': 'S%02dE%02d' % (episode / 13 + 1, episode % 13 + 1),
+        }
+        rnd = random.Random(series * 10000 + episode)
+        program['subtitle'] = ' '.join(rnd.choice(WORDS) for i in range(rnd.randint(1, 4))).capitalize()
+        program['desc'] = ' '.join(rnd.choice(WORDS) for i in range(rnd.randint(10, 40))).capitalize() + '.'
+        return program
+
+
+def xmltv_time(timestamp):
+    return time.strftime('%Y%m%d%H%M%S +0000', time.gmtime(timestamp))
+
+
+def write_xmltv(dataset, output):
+    """
+    Write the data set as XMLTV file.
+    """
+    output.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    output.write('<tv generator-info-name="kaa.epg synthetic">\n')
+    for channel in dataset.channels():
+        output.write('  <channel id="%s.synthetic">\n' % channel['station'])
+        for name in channel['number'], channel['callsign'], channel['name']:
+            output.write('    <display-name>%s</display-name>\n' % escape(str(name)))
+        output.write('  </channel>\n')
+    for channel, start, stop, program_id in dataset.airings():
+        program = dataset.program(program_id)
+        output.write('  <programme start="%s" stop="%s" channel="%s.synthetic">\n' % \
+                     (xmltv_time(start), xmltv_time(stop), channel['station']))
+        output.write('    <title>%s</title>\n' % escape(program['title']))
+        output.write('    <sub-title>%s</sub-title>\n' % escape(program['subtitle']))
+        output.write('    <desc>%s</desc>\n' % escape(program['desc']))
+        output.write('    <date>%d</date>\n' % program['year'])
+        for genre in program['genres']:
+            output.write('    <category>%s</category>\n' % escape(genre))
+        output.write('    <episode-num system="dd_progid">%s.%s</episode-num>\n' % \
+                     (program_id[:10], program_id[10:]))
+        output.write('  </programme>\n')
+    output.write('</tv>\n')
+
+
+def write_schedulesdirect(dataset, output):
+    """
+    Write the data set as Schedules Direct XTVD download response.
+    """
+    output.write('<?xml version="1.0" encoding="utf-8"?>\n')
+    output.write('<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">\n')
+    output.write('<SOAP-ENV:Body><ns1:downloadResponse xmlns:ns1="urn:TMSWebServices">\n')
+    output.write('<xtvdResponse><xtvd from=%s to=%s schemaVersion="1.3">\n' % \
+                 (quoteattr(time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(dataset.start))),
+                  quoteattr(time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(dataset.stop)))))
+    channels = dataset.channels()
+    output.write('<stations>\n')
+    for channel in channels:
+        output.write('<station id="%s"><callSign>%s</callSign><name>%s</name></station>\n' % \
+                     (channel['station'], channel['callsign'], escape(channel['name'])))
+    output.write('</stations>\n<lineups><lineup id="SYN" name="Synthetic" type="CableDigital">\n')
+    for channel in channels:
+        output.write('<map station="%s" channel="%d"/>\n' % (channel['station'], channel['number']))
+    output.write('</lineup></lineups>\n<schedules>\n')
+    program_ids = set()
+    for channel, start, stop, program_id in dataset.airings():
+        program_ids.add(program_id)
+        duration = (stop - start) / 60
+        output.write('<schedule program="%s" station="%s" time="%s" duration="PT%02dH%02dM"%s/>\n' % \
+                     (program_id, channel['station'], time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(start)),
+                      duration / 60, duration % 60, ' closeCaptioned="true"' if start % 7 == 0 else ''))
+    output.write('</schedules>\n<programs>\n')
+    program_ids = sorted(program_ids)
+    for program_id in program_ids:
+        program = dataset.program(program_id)
+        output.write('<program id="%s"><series>%s</series><title>%s</title><subtitle>%s</subtitle>' \
+                     '<description>%s</description><year>%d</year>' \
+                     '<syndicatedEpisodeNumber>%s</syndicatedEpisodeNumber></program>\n' % \
+                     (program_id, program_id[:10], escape(program['title']), escape(program['subtitle']),
+                      escape(program['desc']), program['year'], program['episode']))
+    output.write('</programs>\n<genres>\n')
+    for program_id in program_ids:
+        output.write('<programGenre program="%s">' % program_id)
+        for relevance, genre in enumerate(dataset.program(program_id)['genres']):
+            output.write('<genre><class>%s</class><relevance>%d</relevance></genre>' % (escape(genre), relevance))
+        output.write('</programGenre>\n')
+    output.write('</genres>\n</xtvd></xtvdResponse>\n')
+    output.write('</ns1:downloadResponse></SOAP-ENV:Body></SOAP-ENV:Envelope>\n')
+
+
+WRITERS = {
+    'xmltv': write_xmltv,
+    'schedulesdirect': write_schedulesdirect,
+}
+
+def write(dataset, fmt, filename):
+    """
+    Write the data set in the given format to filename, compressed if the
+    filename ends with .gz.
+    """
+    output = gzip.open(filename, 'wb') if filename.endswith('.gz') else open(filename, 'w')
+    try:
+        WRITERS[fmt](dataset, output)
+    finally:
+        output.close()
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser('usage: %prog [options] xmltv|schedulesdirect FILE')
+    parser.add_option('--channels', type='int', default=50, help='number of channels [%default]')
+    parser.add_option('--days', type='int', default=7, help='number of days [%default]')
+    parser.add_option('--density', type='float', default=1.0,
+                      help='average number of programs per hour and channel [%default]')
+    parser.add_option('--seed', type='int', default=0, help='random seed [%default]')
+    options, args = parser.parse_args()
+    if len(args) != 2 or args[0] not in WRITERS:
+        parser.error('format and file required')
+    t0 = time.time()
+    dataset = Dataset(options.channels, options.days, options.density, seed=options.seed)
+    write(dataset, args[0], args[1])
+    print 'wrote %s in %0.2f secs' % (args[1], time.time() - t0)